@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""records sales one at a time (as the Sale form does) while other threads
+load the analytics page data and stream the sales export, and reports how
+long each sale took to commit. Runs once with SQLite's defaults (rollback
+journal, a new connection per request) and once with the connection
+settings in project/app.py (WAL, pragmas and a pool).
+
+Usage:
+
+    python -m benchmarks.bench_concurrency --sales 300000 --seconds 10
+"""
+
+import os
+import tempfile
+import threading
+import time
+import click
+from sqlalchemy.exc import OperationalError
+
+from project.app import app, db, summary_cache, SQLITE_PRAGMAS, Sale
+from benchmarks.bench_sales_summary import seed
+
+READ_URLS = (
+    '/admin/analytics/api/summary?granularity=month',
+    '/admin/analytics/api/top?by=product',
+    '/admin/analytics/export/sales.csv'
+)
+
+
+def writer(stop, latencies, errors):
+    with app.app_context():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                db.session.add(Sale(quantity=1, product_id=1, staff_id=1, sold_price=10))
+                db.session.commit()
+                latencies.append(time.perf_counter() - t0)
+            except OperationalError:
+                db.session.rollback()
+                errors.append(time.perf_counter() - t0)
+        db.session.remove()
+
+
+def reader(stop, url, counts):
+    client = app.test_client()
+    while not stop.is_set():
+        summary_cache.clear()
+        try:
+            client.get(url).data
+            counts[url] = counts.get(url, 0) + 1
+        except OperationalError:
+            counts[url, 'locked'] = counts.get((url, 'locked'), 0) + 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)] if values else 0
+
+
+def run(label, db_file, n_sales, seconds):
+    seed(db_file, n_sales)
+    stop = threading.Event()
+    latencies, errors, counts = [], [], {}
+    threads = [threading.Thread(target=writer, args=(stop, latencies, errors))]
+    threads += [threading.Thread(target=reader, args=(stop, url, counts)) for url in READ_URLS]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    db.engine.dispose()
+
+    click.echo(label)
+    click.echo("  sales recorded: {0:,} ({1:,.0f}/s), failed with 'database is locked': {2}".format(
+        len(latencies), len(latencies) / seconds, len(errors)
+    ))
+    click.echo("  commit latency: p50 {0:.4f}s | p95 {1:.4f}s | max {2:.4f}s".format(
+        percentile(latencies, 50), percentile(latencies, 95), max(latencies or [0])
+    ))
+    for url in READ_URLS:
+        click.echo("  {0:<48} {1:>5} loads, {2} failed with 'database is locked'".format(
+            url, counts.get(url, 0), counts.get((url, 'locked'), 0)
+        ))
+
+
+@click.command()
+@click.option('--sales', default=300000)
+@click.option('--seconds', default=10)
+def run_benchmark(sales, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['SQLITE_PRAGMAS'] = dict((name, None) for name in SQLITE_PRAGMAS)
+        app.config['SQLITE_POOL_SIZE'] = 0
+        run("SQLite defaults", os.path.join(tmp, 'default.sqlite'), sales, seconds)
+
+        app.config['SQLITE_PRAGMAS'] = {}
+        app.config['SQLITE_POOL_SIZE'] = 5
+        run("WAL, pragmas and pool", os.path.join(tmp, 'tuned.sqlite'), sales, seconds)
+
+
+if __name__ == '__main__':
+    run_benchmark()
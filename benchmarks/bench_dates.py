@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""micro-benchmark of the sale date path: getting a sorted list of YYYY-MM-DD
+chart keys out of the sale table.
+
+Usage:
+
+    python -m benchmarks.bench_dates --rows 100000
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import datetime
+import time
+import click
+
+try:
+    from dateutil.parser import parse
+except ImportError:
+    parse = None
+
+
+def legacy(conn):
+    """generic parser per row, then a sort in python (the old pipeline)"""
+    return sorted(
+        parse(d).strftime('%Y-%m-%d')
+        for (d,) in conn.execute("SELECT date FROM sale WHERE date IS NOT NULL")
+    )
+
+
+def strptime(conn):
+    """fixed-format parse per row, then a sort in python"""
+    return sorted(
+        datetime.datetime.strptime(d[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+        for (d,) in conn.execute("SELECT date FROM sale WHERE date IS NOT NULL")
+    )
+
+
+def sql(conn):
+    """date() and ORDER BY in SQLite (what sales_query does now)"""
+    return [
+        d for (d,) in
+        conn.execute("SELECT date(date) FROM sale WHERE date IS NOT NULL ORDER BY date")
+    ]
+
+
+@click.command()
+@click.option('--rows', default=100000)
+def run_benchmark(rows):
+    rng = random.Random(42)
+    start = datetime.datetime(2015, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'dates.sqlite'))
+        conn.execute("CREATE TABLE sale (id INTEGER PRIMARY KEY, date DATETIME)")
+        conn.execute("CREATE INDEX ix_sale_date ON sale (date)")
+        conn.executemany(
+            "INSERT INTO sale (date) VALUES (?)",
+            (
+                (str(start + datetime.timedelta(seconds=rng.randint(0, 60 * 60 * 24 * 365 * 4))),)
+                for _ in range(rows)
+            )
+        )
+        conn.commit()
+
+        expected = None
+        for fn in (legacy, strptime, sql):
+            if fn is legacy and parse is None:
+                click.echo("{0:<9} skipped (python-dateutil is not installed)".format(fn.__name__))
+                continue
+            t0 = time.perf_counter()
+            result = fn(conn)
+            t = time.perf_counter() - t0
+            expected = expected or result
+            click.echo("{0:<9} {1:8.3f}s  {2:9,.0f} rows/s  {3}".format(
+                fn.__name__, t, rows / t, "ok" if result == expected else "MISMATCH"
+            ))
+        conn.close()
+
+
+if __name__ == '__main__':
+    run_benchmark()
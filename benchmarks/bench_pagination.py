@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""compares Flask-Admin's OFFSET pagination of the Sale list against the
+keyset pagination in `project.app.KeysetModelView`, for shallow and deep
+pages.
+
+Usage:
+
+    python -m benchmarks.bench_pagination --sizes 100000,1000000
+"""
+
+import os
+import tempfile
+import time
+import click
+from flask_admin.contrib.sqla import ModelView
+
+from project.app import app, db, page_cache, Sale, SaleView
+from benchmarks.bench_sales_summary import seed
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+@click.command()
+@click.option('--sizes', default='100000,1000000')
+@click.option('--page-size', default=20)
+def run_benchmark(sizes, page_size):
+    for size in [int(s) for s in sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.sqlite')
+            seed(db_file, size)
+            click.echo("{0:,} sales".format(size))
+            with app.test_request_context():
+                view = SaleView(Sale, db.session, endpoint='bench_sale')
+                last = size // page_size - 1
+                for page in sorted({0, 1, 100, last // 2, last}):
+                    args = (page, None, None, None, None, True, page_size)
+                    offset_t, (_, offset_rows) = timed(ModelView.get_list, view, *args)
+                    page_cache.clear()
+                    cold_t, (_, rows) = timed(view.get_list, *args)
+                    warm_t, _ = timed(view.get_list, *args)
+                    next_t, _ = timed(view.get_list, page + 1, *args[1:])
+                    # OFFSET orders by date alone, so ties may come in a different order
+                    same = [r.date for r in rows] == [r.date for r in offset_rows]
+                    click.echo(
+                        "  page {0:>7,} | offset {1:8.4f}s | keyset cold {2:8.4f}s"
+                        " | cached {3:8.4f}s | next page {4:8.4f}s | {5}".format(
+                            page, offset_t, cold_t, warm_t, next_t,
+                            "same dates" if same else "DIFFERENT"
+                        )
+                    )
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""compares searching the Product and Sale lists with Flask-Admin's LIKE
+'%term%' search against the product_search full-text index, on a large
+catalog.
+
+Usage:
+
+    python -m benchmarks.bench_product_search --products 100000 --sales 1000000
+"""
+
+import os
+import tempfile
+import time
+import click
+from flask_admin.contrib.sqla import ModelView
+
+from project.app import app, db, Product, Sale, ProductView, SaleView
+from db_setup import set_trigger_fullname, set_product_search
+from benchmarks.bench_sales_summary import seed
+from benchmarks.bench_top_sellers import add_suppliers_and_tags
+
+TERMS = ('Product 4242', 'Supplier 7', 'Tag 3', 'P99', 'nothing')
+
+
+def search(view, apply_search, term, page_size=20):
+    """count and first page of results, the way the list view gets them"""
+    query, count_query, _, _ = apply_search(
+        view, view.get_query(), view.get_count_query(), {}, {}, term
+    )
+    return count_query.scalar(), query.limit(page_size).all()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+@click.command()
+@click.option('--products', default=100000)
+@click.option('--sales', default=1000000)
+def run_benchmark(products, sales):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'bench.sqlite')
+        seed(db_file, sales, n_products=products)
+        add_suppliers_and_tags(db_file, n_suppliers=max(products // 100, 1))
+        set_trigger_fullname(db_file)
+        t, _ = timed(set_product_search, db_file)
+        click.echo("{0:,} products, {1:,} sales; index built in {2:.2f}s".format(products, sales, t))
+        with app.test_request_context():
+            for view in (
+                ProductView(Product, db.session, endpoint='bench_product'),
+                SaleView(Sale, db.session, endpoint='bench_sale')
+            ):
+                click.echo(view.model.__name__)
+                for term in TERMS:
+                    like_t, (like_count, _) = timed(search, view, ModelView._apply_search, term)
+                    fts_t, (fts_count, _) = timed(search, view, type(view)._apply_search, term)
+                    click.echo("  {0:<14} | LIKE {1:8.4f}s {2:>9,} rows | fts {3:8.4f}s {4:>9,} rows".format(
+                        repr(term), like_t, like_count, fts_t, fts_count
+                    ))
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""sales recorded per second on a synthetic database (see
+benchmarks/synthetic.py), one sale per commit as the Sale form does, against
+whole baskets recorded with record_receipt (a single executemany and commit
+per basket) and through the checkout JSON endpoint. Each case starts from a
+fresh copy of the same database, and the selling price, amount, rollup and
+inventory triggers run for every sale in all of them.
+
+Usage:
+
+    python -m benchmarks.bench_receipts --sales 100000 --records 2000 --basket 10
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import click
+
+from project.app import app, db, record_receipt, Product, Sale, Staff
+from benchmarks.synthetic import generate
+
+
+def baskets(records, basket, n_products, n_staff, seed_value=42):
+    """(staff_id, lines) for enough baskets to make `records` sales"""
+    rng = random.Random(seed_value)
+    lines = [
+        {'product_id': rng.randint(1, n_products), 'quantity': rng.choice((1, 1, 1, 2, 3))}
+        for _ in range(records)
+    ]
+    return [
+        (rng.randint(1, n_staff), lines[i:i + basket])
+        for i in range(0, records, basket)
+    ]
+
+
+def one_by_one(work):
+    for (staff_id, lines) in work:
+        for line in lines:
+            db.session.add(Sale(staff_id=staff_id, **line))
+            db.session.commit()
+
+
+def receipts(work):
+    for (staff_id, lines) in work:
+        receipt_id, errors = record_receipt(lines, staff_id=staff_id)
+        assert not errors, errors
+
+
+def receipts_api(work):
+    client = app.test_client()
+    for (staff_id, lines) in work:
+        response = client.post(
+            '/admin/checkout/api/receipts',
+            data=json.dumps({'staff_id': staff_id, 'lines': lines}),
+            content_type='application/json'
+        )
+        assert response.status_code == 201, response.data
+
+
+CASES = (
+    ('one sale per commit', one_by_one),
+    ('record_receipt', receipts),
+    ('checkout JSON api', receipts_api),
+)
+
+
+@click.command()
+@click.option('--sales', default=100000, help='size of the synthetic database')
+@click.option('--records', default=2000, help='sales to record in each case')
+@click.option('--basket', default=10, help='line items per receipt')
+def run_benchmark(sales, records, basket):
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'base.sqlite')
+        generate(base, sales)
+        n_products = db.session.query(db.func.max(Product.id)).scalar()
+        n_staff = db.session.query(db.func.max(Staff.id)).scalar()
+        db.session.remove()
+        db.engine.dispose()
+        work = baskets(records, basket, n_products, n_staff)
+        click.echo("{0:,} sales in the database; recording {1:,} more in baskets of {2}".format(
+            sales, records, basket
+        ))
+
+        first = None
+        for (name, fn) in CASES:
+            db_file = os.path.join(tmp, 'bench.sqlite')
+            shutil.copy(base, db_file)
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+            t0 = time.perf_counter()
+            fn(work)
+            t = time.perf_counter() - t0
+            db.session.remove()
+            db.engine.dispose()
+            os.remove(db_file)
+            rate = records / t
+            first = first or rate
+            click.echo("  {0:<20} {1:8.3f}s {2:10,.0f} sales/s  ({3:.1f}x)".format(name, t, rate, rate / first))
+
+
+if __name__ == '__main__':
+    run_benchmark()
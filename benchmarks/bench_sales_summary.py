@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""compares fetching/filtering sales in python (petl) against pushing the
+date and staff filters down into SQL (see `project.app.sales_query`).
+
+Usage:
+
+    python -m benchmarks.bench_sales_summary --sizes 10000,100000,1000000
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import datetime
+import time
+import click
+import petl as etl
+
+from project.app import app, db, sales_query
+from db_setup import set_trigger_sale_amounts
+
+
+def seed(db_file, n_sales, n_products=500, n_staff=5, seed_value=42):
+    """fill a fresh database with n_sales randomly generated sales
+    """
+    rng = random.Random(seed_value)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+    db.create_all()
+
+    start = datetime.datetime(2015, 1, 1)
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.executemany(
+        "INSERT INTO staff (id, name) VALUES (?, ?)",
+        [(i, "Staff {0}".format(i)) for i in range(1, n_staff + 1)]
+    )
+    c.executemany(
+        "INSERT INTO product (id, code, name, list_price, selling_price) VALUES (?, ?, ?, ?, ?)",
+        [
+            (i, "P{0}".format(i), "Product {0}".format(i), p, round(p * 1.5, 2))
+            for i, p in ((i, round(rng.uniform(1, 50), 2)) for i in range(1, n_products + 1))
+        ]
+    )
+    c.executemany(
+        "INSERT INTO sale (quantity, date, product_id, staff_id, sold_price) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                rng.randint(1, 3),
+                str(start + datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 4))),
+                rng.randint(1, n_products),
+                rng.randint(1, n_staff),
+                round(rng.uniform(1, 75), 2)
+            )
+            for _ in range(n_sales)
+        )
+    )
+    conn.commit()
+    conn.close()
+    set_trigger_sale_amounts(db_file)
+
+
+def legacy_fetch(start_dt, end_dt, staff_id):
+    """the original approach: pull every table and filter/join in python
+    """
+    products_records = etl.fromdb(db.engine, 'SELECT * FROM product')
+    sales_records = etl.fromdb(db.engine, 'SELECT * FROM sale')
+    staff_records = etl.fromdb(db.engine, 'SELECT * FROM staff')
+    sales_records = etl\
+        .selectnotnone(sales_records, 'date')\
+        .select(lambda r: r.date >= str(start_dt) and r.date <= str(end_dt))\
+        .select('staff_id', lambda v: v == staff_id)
+    return etl\
+        .join(sales_records, products_records, lkey='product_id', rkey='id')\
+        .leftjoin(staff_records, lkey='staff_id', rkey='id')
+
+
+def sql_fetch(start_dt, end_dt, staff_id):
+    return etl.fromdb(
+        db.engine,
+        sales_query(start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+    )
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    n = etl.nrows(fn(*args))
+    return time.perf_counter() - t0, n
+
+
+@click.command()
+@click.option('--sizes', default='10000,100000,1000000')
+def run_benchmark(sizes):
+    """time both fetch paths for a 90-day window and a single staff member
+    """
+    start_dt = datetime.datetime(2017, 1, 1)
+    end_dt = datetime.datetime(2017, 4, 1)
+    staff_id = 1
+    for n in [int(s) for s in sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            seed(os.path.join(tmp, 'bench.sqlite'), n)
+            legacy_t, legacy_n = timed(legacy_fetch, start_dt, end_dt, staff_id)
+            sql_t, sql_n = timed(sql_fetch, start_dt, end_dt, staff_id)
+            db.engine.dispose()
+        click.echo(
+            "{0:>9,} sales | python filter {1:8.3f}s | sql filter {2:8.3f}s | {3:6.1f}x | rows {4}/{5}".format(
+                n, legacy_t, sql_t, legacy_t / sql_t, legacy_n, sql_n
+            )
+        )
+
+
+if __name__ == '__main__':
+    run_benchmark()
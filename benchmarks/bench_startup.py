@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""times a cold desktop launch, from starting python to the first page the
+window shows ('/') being served, for launch.py's ServerThread (readiness
+signalled by the server once its socket is bound) and for the previous
+approach (app.run in a thread, polled with a new connection every 100 ms).
+Each launch is a fresh process, so imports are included. The window itself
+isn't opened.
+
+Usage:
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_PAINT = """
+from http.client import HTTPConnection
+conn = HTTPConnection('127.0.0.1', PORT)
+conn.request('GET', '/')
+assert conn.getresponse().status == 200
+print(time.time())
+"""
+
+LAUNCHERS = {
+    'polling': """
+import time
+import logging
+from threading import Thread
+from project.app import app
+
+logger = logging.getLogger(__name__)
+
+def url_ok(url, port):
+    from http.client import HTTPConnection
+    try:
+        conn = HTTPConnection(url, port)
+        conn.request("GET", "/")
+        r = conn.getresponse()
+        return r.status == 200
+    except:
+        logger.exception("Server not started")
+        return False
+
+t = Thread(target=lambda: app.run(host="127.0.0.1", port=PORT, threaded=True, debug=False))
+t.daemon = True
+t.start()
+while not url_ok("127.0.0.1", PORT):
+    time.sleep(0.1)
+""",
+    'ready event': """
+import time
+from launch import ServerThread
+
+server = ServerThread(port=PORT)
+server.start()
+server.wait()
+"""
+}
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def launch(code):
+    """seconds from starting the process to the first page being served"""
+    port = free_port()
+    t0 = time.time()
+    out = subprocess.check_output(
+        [sys.executable, '-c', (code + FIRST_PAINT).replace('PORT', str(port))],
+        cwd=ROOT, stderr=subprocess.DEVNULL
+    )
+    return float(out.decode().strip().splitlines()[-1]) - t0
+
+
+def import_time():
+    """seconds to import project.app, and whether petl was loaded"""
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        "import sys, time; t = time.perf_counter(); import project.app; "
+        "print(time.perf_counter() - t, 'petl' in sys.modules)"
+    ], cwd=ROOT)
+    t, petl = out.decode().split()
+    return float(t), petl == 'True'
+
+
+@click.command()
+@click.option('--runs', default=5)
+def run_benchmark(runs):
+    t, petl = import_time()
+    click.echo("import project.app: {0:.3f}s (petl loaded: {1})".format(t, petl))
+    for name, code in LAUNCHERS.items():
+        times = [launch(code) for _ in range(runs)]
+        click.echo("{0:<12} first page after median {1:.3f}s | min {2:.3f}s | max {3:.3f}s".format(
+            name, statistics.median(times), min(times), max(times)
+        ))
+
+
+if __name__ == '__main__':
+    run_benchmark()
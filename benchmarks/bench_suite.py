@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""times the main workloads on synthetic databases (see
+benchmarks/synthetic.py) of increasing size: the sales summaries, the
+Sales and Products list pages, run_backup and loading the source csvs with
+db_setup. Save the results as a baseline and compare later runs against it
+to catch regressions; the command fails if any case got slower than the
+baseline by more than the tolerance.
+
+Usage:
+
+    python -m benchmarks.bench_suite --sizes 1000,100000,1000000 --save baseline.json
+    python -m benchmarks.bench_suite --sizes 1000,100000,1000000 --baseline baseline.json
+"""
+
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+import click
+import petl as etl
+
+from project.app import (
+    app, db, clear_caches, Supplier, Product, Tag, Staff,
+    sales_summary, analytics_summary
+)
+from project.utils.backup import run_backup
+from db_setup import (
+    bulk_import, supplier_columns, product_columns, tag_columns, staff_columns
+)
+from benchmarks.synthetic import generate
+
+# a case is allowed to take this much longer than the baseline (in seconds)
+# on top of the tolerance, so that timer noise on tiny cases isn't reported
+NOISE = 0.005
+
+
+def get_page(client, url):
+    def run():
+        clear_caches()
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        return response.data
+    return run
+
+
+def summary(fn, **kwargs):
+    def run():
+        clear_caches()
+        return fn(**kwargs)
+    return run
+
+
+def backup(db_file, tmp):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_backup.callback(db_file, os.path.join(tmp, 'backups'), as_csv=False, keep=1)
+    return run
+
+
+def export_sources(db_file, tmp):
+    """write the generated suppliers, products, tags and staff out as csvs
+    laid out like the ones in sources/
+
+    Returns:
+        [list] -- (csv path, table, columns, key) for each
+    """
+    conn = sqlite3.connect(db_file)
+    sources = []
+    for (name, model, columns, key) in (
+        ('Suppliers.csv', Supplier, supplier_columns, 'id'),
+        ('Products.csv', Product, product_columns, 'code'),
+        ('Categories.csv', Tag, tag_columns, 'id'),
+        ('Staff.csv', Staff, staff_columns, 'id')
+    ):
+        path = os.path.join(tmp, name)
+        query = "SELECT {0} FROM {1}".format(
+            ', '.join('{0} AS "{1}"'.format(c, src) for (c, (src, _)) in columns.items()),
+            model.__tablename__
+        )
+        etl.tocsv(etl.fromdb(conn, query), path)
+        sources.append((path, model.__table__, columns, key))
+    conn.close()
+    return sources
+
+
+def load_sources(sources, tmp):
+    """db_setup's csv import, into a fresh database"""
+    def run():
+        db_file = os.path.join(tmp, 'load.sqlite')
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+        db.create_all()
+        with db.engine.begin() as conn:
+            for (path, table, columns, key) in sources:
+                assert not bulk_import(conn, etl.fromcsv(path), table, columns, key)
+        db.engine.dispose()
+    return run
+
+
+def cases(db_file, tmp):
+    """(name, callable) for every case, run against db_file"""
+    client = app.test_client()
+    yield 'sales_summary', summary(sales_summary, granularity='month')
+    yield 'analytics_summary (rollup)', summary(analytics_summary, granularity='month')
+    yield 'sale list', get_page(client, '/admin/sale/')
+    yield 'sale list, page 50', get_page(client, '/admin/sale/?page=49')
+    yield 'sale list, search', get_page(client, '/admin/sale/?search=Product+42')
+    yield 'product list', get_page(client, '/admin/product/')
+    yield 'product list, search', get_page(client, '/admin/product/?search=Supplier+3')
+    yield 'run_backup', backup(db_file, tmp)
+    yield 'db_setup import', load_sources(export_sources(db_file, tmp), tmp)
+
+
+def best_of(fn, repeat, budget=2.0):
+    """fastest of up to `repeat` runs, stopping early once `budget` seconds
+    have been spent, so big cases run once
+    """
+    times = []
+    while len(times) < repeat and sum(times) < budget:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def compare(results, baseline, tolerance):
+    """the cases that got slower than the baseline allows
+
+    Returns:
+        [list] -- (size, case, baseline seconds, seconds)
+    """
+    slower = []
+    for size, timings in results.items():
+        for case, t in timings.items():
+            base = baseline.get(size, {}).get(case)
+            if base is not None and t > base * (1 + tolerance) + NOISE:
+                slower.append((size, case, base, t))
+    return slower
+
+
+@click.command()
+@click.option('--sizes', default='1000,100000,1000000', help='numbers of sales, comma separated')
+@click.option('--repeat', default=5, help='runs per case; the fastest is kept')
+@click.option('--save', type=click.Path(), help='write the results to this json file')
+@click.option('--baseline', type=click.Path(exists=True), help='compare with results saved earlier')
+@click.option('--tolerance', default=0.25, help='allowed slowdown over the baseline, e.g. 0.25 for 25%')
+def run_benchmark(sizes, repeat, save, baseline, tolerance):
+    base = {}
+    if baseline:
+        with open(baseline) as f:
+            base = json.load(f)
+
+    results = OrderedDict()
+    for size in [int(s) for s in sizes.split(',')]:
+        key = str(size)
+        results[key] = OrderedDict()
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.sqlite')
+            t0 = time.perf_counter()
+            generate(db_file, size)
+            click.echo("{0:,} sales (generated in {1:.1f}s)".format(size, time.perf_counter() - t0))
+            for (case, fn) in cases(db_file, tmp):
+                # cases that switch databases (db_setup import) come last
+                app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+                t = results[key][case] = best_of(fn, repeat)
+                previous = base.get(key, {}).get(case)
+                click.echo("  {0:<28} {1:9.4f}s{2}".format(
+                    case, t,
+                    "  (baseline {0:.4f}s, {1:+.0%})".format(previous, t / previous - 1) if previous else ''
+                ))
+            db.engine.dispose()
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo("saved {0}".format(save))
+
+    slower = compare(results, base, tolerance)
+    if slower:
+        for (size, case, before, after) in slower:
+            click.echo("{0:>9} sales | {1:<28} {2:.4f}s -> {3:.4f}s".format(
+                size, case, before, after
+            ), err=True)
+        raise click.ClickException(
+            "{0} case(s) more than {1:.0%} slower than {2}".format(len(slower), tolerance, baseline)
+        )
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""times supplier renames and product edits on a large catalog, with the
+original fullname triggers against the ones from `db_setup.set_trigger_fullname`.
+
+Usage:
+
+    python -m benchmarks.bench_supplier_update --products 50000
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+import click
+
+from project.app import app, db
+from db_setup import set_trigger_fullname
+
+FULLNAME = "(SELECT supplier.name FROM supplier WHERE supplier.id = product.supplier_id) || ' | ' || product.name || ' | $' || product.list_price || ' list / $' || product.selling_price || ' selling price'"
+
+# the triggers as they were before, for comparison
+LEGACY_TRIGGERS = [
+    """
+    CREATE TRIGGER product_update_fullname AFTER UPDATE ON product FOR EACH ROW
+    BEGIN UPDATE product SET fullname = {0} WHERE id = new.id; END;
+    """.format(FULLNAME),
+    """
+    CREATE TRIGGER product_insert_fullname AFTER INSERT ON product FOR EACH ROW
+    BEGIN UPDATE product SET fullname = {0} WHERE id = new.id; END;
+    """.format(FULLNAME),
+    """
+    CREATE TRIGGER update_supplier_update_product_fullname AFTER UPDATE ON supplier FOR EACH ROW
+    BEGIN UPDATE product SET fullname = {0}; END;
+    """.format(FULLNAME)
+]
+
+
+def build(db_file, n_products, n_suppliers, legacy):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+    db.create_all()
+    db.engine.dispose()
+    if legacy:
+        conn = sqlite3.connect(db_file)
+        for each in LEGACY_TRIGGERS:
+            conn.execute(each)
+        conn.commit()
+        conn.close()
+    else:
+        set_trigger_fullname(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.executemany(
+        "INSERT INTO supplier (id, name) VALUES (?, ?)",
+        [(i, "Supplier {0}".format(i)) for i in range(1, n_suppliers + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO product (code, name, list_price, selling_price, supplier_id) VALUES (?, ?, ?, ?, ?)",
+        (
+            ("P{0}".format(i), "Product {0}".format(i), 1.0, 2.0, i % n_suppliers + 1)
+            for i in range(n_products)
+        )
+    )
+    conn.commit()
+    return conn
+
+
+def timed(conn, statements):
+    """run each statement in its own transaction; returns (seconds, rows written)
+    """
+    changes = conn.total_changes
+    t0 = time.perf_counter()
+    for (sql, params) in statements:
+        conn.execute(sql, params)
+        conn.commit()
+    return time.perf_counter() - t0, conn.total_changes - changes
+
+
+@click.command()
+@click.option('--products', default=50000)
+@click.option('--suppliers', default=500)
+@click.option('--edits', default=20)
+def run_benchmark(products, suppliers, edits):
+    cases = [
+        ("rename supplier", [
+            ("UPDATE supplier SET name = ? WHERE id = ?", ("Renamed {0}".format(i), i))
+            for i in range(1, edits + 1)
+        ]),
+        ("edit product description", [
+            ("UPDATE product SET description = ? WHERE id = ?", ("edited", i))
+            for i in range(1, edits + 1)
+        ]),
+        ("edit product price", [
+            ("UPDATE product SET list_price = list_price + 1 WHERE id = ?", (i,))
+            for i in range(1, edits + 1)
+        ])
+    ]
+    for legacy in (True, False):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = build(os.path.join(tmp, 'bench.sqlite'), products, suppliers, legacy)
+            for (name, statements) in cases:
+                t, changes = timed(conn, statements)
+                click.echo("{0:<9} {1:<26} {2:8.4f}s per edit | {3:>8,} rows written".format(
+                    "legacy" if legacy else "current", name, t / len(statements), changes
+                ))
+            conn.close()
+
+
+if __name__ == '__main__':
+    run_benchmark()
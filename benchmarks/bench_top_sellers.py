@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""times the top-sellers reports: ranked in SQL over the sales_daily rollup,
+with a streaming heap over the joined sales, and by sorting every sale in
+python (the naive approach), and checks that all three agree.
+
+Usage:
+
+    python -m benchmarks.bench_top_sellers --sizes 1000000
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import click
+
+from project.app import (
+    db, RANKINGS, METRICS, sales_query, calculate_gross_sales,
+    top_sellers_from_rollup, top_sellers_from_sales
+)
+from db_setup import backfill_sales_daily
+from benchmarks.bench_sales_summary import seed
+
+
+def add_suppliers_and_tags(db_file, n_suppliers=50, n_tags=20, seed_value=42):
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(db_file)
+    conn.executemany(
+        "INSERT INTO supplier (id, name) VALUES (?, ?)",
+        [(i, "Supplier {0}".format(i)) for i in range(1, n_suppliers + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO tag (id, name) VALUES (?, ?)",
+        [(i, "Tag {0}".format(i)) for i in range(1, n_tags + 1)]
+    )
+    products = [r[0] for r in conn.execute("SELECT id FROM product")]
+    conn.executemany(
+        "UPDATE product SET supplier_id = ? WHERE id = ?",
+        [(rng.randint(1, n_suppliers), p) for p in products]
+    )
+    conn.executemany(
+        "INSERT INTO product_tags (product_id, tag_id) VALUES (?, ?)",
+        [(p, t) for p in products for t in rng.sample(range(1, n_tags + 1), 2)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def naive_top_products(n):
+    """sort every sale's gross in python, then total up the first n products
+    """
+    rows = [dict(r) for r in db.engine.execute(sales_query())]
+    totals = {}
+    for rec in rows:
+        totals[rec['product_id']] = totals.get(rec['product_id'], 0) + calculate_gross_sales(rec)
+    return sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+@click.command()
+@click.option('--sizes', default='1000000')
+@click.option('-n', default=10)
+def run_benchmark(sizes, n):
+    for size in [int(s) for s in sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.sqlite')
+            seed(db_file, size)
+            add_suppliers_and_tags(db_file)
+            backfill_sales_daily(db_file)
+            click.echo("{0:,} sales".format(size))
+            for by in RANKINGS:
+                for metric in METRICS:
+                    sql_t, sql_top = timed(top_sellers_from_rollup, by, metric, n)
+                    heap_t, heap_top = timed(top_sellers_from_sales, by, metric, n)
+                    same = [r['id'] for r in sql_top] == [r['id'] for r in heap_top]
+                    click.echo("  {0:<8} by {1:<6} | rollup sql {2:8.4f}s | streaming heap {3:8.3f}s | {4}".format(
+                        by, metric, sql_t, heap_t, "same ranking" if same else "DIFFERENT"
+                    ))
+            naive_t, _ = timed(naive_top_products, n)
+            click.echo("  naive sort of every sale (products by gross): {0:8.3f}s".format(naive_t))
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    run_benchmark()
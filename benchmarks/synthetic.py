@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""generates a synthetic inventory database of any size: suppliers,
+products (with tags, stock receipts and a long tail of slow sellers), staff
+and sales. Sales follow a yearly season, a weekly cycle, opening hours and
+a growth trend, and include special prices, list price sales, and NULL
+quantities and dates, as the real data does. The same seed always gives the
+same database.
+
+The triggers, rollup, inventory and search index are set up afterwards
+with db_setup.py, as for a real database.
+
+Usage:
+
+    python -m benchmarks.synthetic inventory.sqlite --sales 100000 --seed 42
+"""
+
+import bisect
+import datetime
+import itertools
+import math
+import random
+import sqlite3
+import click
+
+from project.app import app, db
+from db_setup import (
+    set_trigger_fullname, set_trigger_selling_price, set_trigger_sale_amounts,
+    set_trigger_sales_daily, backfill_sales_daily, set_trigger_inventory,
+    backfill_inventory, set_product_search
+)
+
+END_DATE = datetime.date(2018, 1, 1)
+
+# relative number of sales by month (Jan..Dec) and weekday (Mon..Sun)
+MONTH_WEIGHTS = (0.7, 0.7, 0.85, 0.9, 1.0, 0.9, 0.8, 0.85, 1.0, 1.05, 1.3, 1.9)
+WEEKDAY_WEIGHTS = (0.8, 0.85, 0.9, 1.0, 1.3, 1.7, 0.4)
+# opening hours, busiest over lunch and after work
+HOUR_WEIGHTS = {9: 3, 10: 5, 11: 7, 12: 10, 13: 9, 14: 6, 15: 6, 16: 7, 17: 9, 18: 5}
+
+# share of sales with a special price, sold at list price, and with no
+# quantity (counted as 1) or no date recorded
+SPECIAL_PRICE_RATE = 0.04
+LIST_PRICE_RATE = 0.02
+NULL_QUANTITY_RATE = 0.03
+NULL_DATE_RATE = 0.002
+
+TAGS = (
+    'Produce', 'Dairy', 'Bakery', 'Frozen', 'Beverages', 'Snacks', 'Canned',
+    'Dry Goods', 'Bulk', 'Spices', 'Condiments', 'Household', 'Personal Care',
+    'Organic', 'Local', 'Gluten Free', 'Vegan', 'Seasonal', 'Gifts', 'Clearance'
+)
+
+
+def scale(n_sales):
+    """default (suppliers, products, staff) for a database with n_sales"""
+    n_products = min(max(n_sales // 200, 50), 20000)
+    return max(n_products // 25, 5), n_products, min(max(n_sales // 50000, 4), 25)
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def day_weights(days, start):
+    """relative sales on each day: season, weekday and a steady growth trend"""
+    weights = []
+    for i in range(days):
+        day = start + datetime.timedelta(days=i)
+        weights.append(
+            MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * (1 + i / 365.0 * 0.15)
+        )
+    return weights
+
+
+def sales_per_day(rng, n_sales, weights):
+    """split n_sales across the days in proportion to their weights"""
+    total = sum(weights)
+    counts = [int(n_sales * w / total) for w in weights]
+    cum = cumulative(weights)
+    for _ in range(n_sales - sum(counts)):
+        counts[bisect.bisect(cum, rng.random() * cum[-1])] += 1
+    return counts
+
+
+def make_suppliers(rng, n):
+    kinds = ('Farms', 'Foods', 'Trading Co.', 'Wholesale', 'Imports', 'Provisions')
+    return [
+        (i, "Supplier {0} {1}".format(i, rng.choice(kinds)), "contact{0}@example.com".format(i))
+        for i in range(1, n + 1)
+    ]
+
+
+def make_products(rng, n, n_suppliers):
+    """(id, code, name, list_price, selling_price, quantity_per_unit,
+    description, supplier_id, discontinued, initial_volume)
+    """
+    products = []
+    for i in range(1, n + 1):
+        # most items are cheap, a few are expensive
+        list_price = round(min(rng.lognormvariate(1.6, 0.8), 400), 2)
+        selling_price = round(list_price * rng.uniform(1.25, 1.9), 2)
+        products.append((
+            i,
+            "P{0:06d}".format(i),
+            "Product {0}".format(i),
+            list_price,
+            selling_price,
+            rng.choice((1, 1, 1, 6, 12, 24)),
+            "Synthetic product {0}".format(i) if rng.random() < 0.7 else None,
+            rng.randint(1, n_suppliers),
+            rng.random() < 0.05,
+            rng.randint(0, 200)
+        ))
+    return products
+
+
+def make_sales(rng, n_sales, products, n_staff, years):
+    """yields (quantity, date, special_price, use_list_price, product_id,
+    staff_id, sold_price) in date order (sales with no date come mixed in)
+    """
+    start = END_DATE - datetime.timedelta(days=365 * years)
+    days = (END_DATE - start).days
+    counts = sales_per_day(rng, n_sales, day_weights(days, start))
+
+    # a few products sell far more than the rest
+    popularity = list(range(len(products)))
+    rng.shuffle(popularity)
+    product_cum = cumulative([1.0 / math.pow(rank + 1, 0.8) for rank in popularity])
+    staff_cum = cumulative([rng.uniform(0.5, 2) for _ in range(n_staff)])
+    hours = sorted(HOUR_WEIGHTS)
+    hour_cum = cumulative([HOUR_WEIGHTS[h] for h in hours])
+
+    for i, count in enumerate(counts):
+        day = datetime.datetime.combine(start + datetime.timedelta(days=i), datetime.time())
+        times = sorted(
+            datetime.timedelta(
+                hours=hours[bisect.bisect(hour_cum, rng.random() * hour_cum[-1])],
+                seconds=rng.randint(0, 3599)
+            )
+            for _ in range(count)
+        )
+        for t in times:
+            product = products[bisect.bisect(product_cum, rng.random() * product_cum[-1])]
+            r = rng.random()
+            special_price = None
+            use_list_price = False
+            sold_price = product[4]
+            if r < SPECIAL_PRICE_RATE:
+                special_price = sold_price = round(product[4] * rng.uniform(0.6, 0.9), 2)
+            elif r < SPECIAL_PRICE_RATE + LIST_PRICE_RATE:
+                use_list_price = True
+                sold_price = product[3]
+            yield (
+                None if rng.random() < NULL_QUANTITY_RATE else rng.choice((1, 1, 1, 1, 2, 2, 3, 4, 6)),
+                None if rng.random() < NULL_DATE_RATE else str(day + t),
+                special_price,
+                use_list_price,
+                product[0],
+                bisect.bisect(staff_cum, rng.random() * staff_cum[-1]) + 1,
+                sold_price
+            )
+
+
+def generate(db_file, n_sales, n_suppliers=None, n_products=None, n_staff=None, years=3, seed_value=42):
+    """fill a fresh database at db_file with synthetic data, then set up its
+    triggers, rollup, inventory and search index with db_setup.
+
+    Arguments:
+        db_file {str} -- path of the (new) SQLite database
+        n_sales {int} -- how many sales to generate
+
+    Keyword Arguments:
+        n_suppliers {int} -- suppliers; scaled to n_sales if None (default: {None})
+        n_products {int} -- products; scaled to n_sales if None (default: {None})
+        n_staff {int} -- staff; scaled to n_sales if None (default: {None})
+        years {int} -- sales are spread over this many years up to the end of
+            2017 (default: {3})
+        seed_value {int} -- random seed (default: {42})
+    """
+    rng = random.Random(seed_value)
+    default_suppliers, default_products, default_staff = scale(n_sales)
+    n_suppliers = n_suppliers or default_suppliers
+    n_products = n_products or default_products
+    n_staff = n_staff or default_staff
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+    db.create_all()
+
+    suppliers = make_suppliers(rng, n_suppliers)
+    products = make_products(rng, n_products, n_suppliers)
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.executemany("INSERT INTO supplier (id, name, email) VALUES (?, ?, ?)", suppliers)
+    c.executemany(
+        """INSERT INTO product (id, code, name, list_price, selling_price, quantity_per_unit,
+        description, supplier_id, discontinued, initial_volume) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        products
+    )
+    c.executemany("INSERT INTO tag (id, name) VALUES (?, ?)", list(enumerate(TAGS, start=1)))
+    c.executemany(
+        "INSERT INTO product_tags (product_id, tag_id) VALUES (?, ?)",
+        [(p[0], t) for p in products for t in rng.sample(range(1, len(TAGS) + 1), rng.randint(1, 3))]
+    )
+    c.executemany(
+        "INSERT INTO staff (id, name) VALUES (?, ?)",
+        [(i, "Staff {0}".format(i)) for i in range(1, n_staff + 1)]
+    )
+    c.executemany(
+        "INSERT INTO stock (product_id, units_purchased, use_list_price, date) VALUES (?, ?, ?, ?)",
+        [
+            (
+                p[0], rng.randint(10, 200), True,
+                str(datetime.datetime.combine(END_DATE, datetime.time()) - datetime.timedelta(days=rng.randint(1, 365 * years)))
+            )
+            for p in products for _ in range(rng.randint(0, 4))
+        ]
+    )
+    c.executemany(
+        """INSERT INTO sale (quantity, date, special_price, use_list_price, product_id, staff_id, sold_price)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        make_sales(rng, n_sales, products, n_staff, years)
+    )
+    conn.commit()
+    conn.close()
+
+    set_trigger_fullname(db_file)
+    set_trigger_selling_price(db_file)
+    set_trigger_sale_amounts(db_file)
+    set_trigger_sales_daily(db_file)
+    backfill_sales_daily(db_file)
+    set_trigger_inventory(db_file)
+    backfill_inventory(db_file)
+    set_product_search(db_file)
+
+
+@click.command()
+@click.argument('db_file')
+@click.option('--sales', default=100000)
+@click.option('--suppliers', default=None, type=int)
+@click.option('--products', default=None, type=int)
+@click.option('--staff', default=None, type=int)
+@click.option('--years', default=3)
+@click.option('--seed', 'seed_value', default=42)
+def cli(db_file, sales, suppliers, products, staff, years, seed_value):
+    """writes a synthetic inventory database to DB_FILE (which should not
+    exist yet)
+    """
+    generate(db_file, sales, suppliers, products, staff, years, seed_value)
+    click.echo("{0:,} sales: {1}".format(sales, db_file))
+
+
+if __name__ == '__main__':
+    cli()
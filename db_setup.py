@@ -3,10 +3,14 @@
 import os
 import csv
 import sqlite3
+import itertools
+import click
 import petl as etl
+from sqlalchemy import bindparam, inspect, select
+from sqlalchemy.exc import IntegrityError
 
 from project.app import app, db
-from project.app import Product, Supplier, Tag, Staff
+from project.app import Product, Supplier, Tag, Staff, Stock, Inventory, SalesDaily
 
 #db_path = r"C:\GitHub\fc-inventory\project\db.sqlite"
 app_dir = os.path.realpath(os.path.dirname(__file__))
@@ -22,50 +26,172 @@ src_tags = etl.fromcsv("sources/Categories.csv")
 src_staff = etl.fromcsv("sources/Staff.csv")
 
 
-def create_suppliers():
-    for row in etl.dicts(src_suppliers):
-        new_supplier = Supplier(
-            id=row["ID"],
-            name=row["Company"]
-        )
-        db.session.add(new_supplier)
-    db.session.commit()
-
-
-def create_products():
-    for row in etl.dicts(src_products):
-        new_product = Product(
-            code=row["ProductCode"],
-            name=row["ProductName"],
-            list_price=row["StandardCost"],
-            selling_price=row["ListPrice"],
-            quantity_per_unit=row["QuantityPerUnit"],
-            description=row["Description"],
-            supplier_id=row["SupplierID"],
-            discontinued=row["Discontinued"],
-        )
-        db.session.add(new_product)
-    db.session.commit()
+# type coercion for csv values. Each takes the raw string and returns the
+# value to store (None for an empty cell), or raises ValueError.
 
+def to_text(v):
+    v = (v or '').strip()
+    return v if v else None
 
-def create_tags():
-    for row in etl.dicts(src_tags):
-        new_row = Tag(
-            id=row["ID"],
-            name=row["Category"]
-        )
-        db.session.add(new_row)
-    db.session.commit()
 
+def to_int(v):
+    v = to_text(v)
+    return int(v) if v is not None else None
 
-def create_staff():
-    for row in etl.dicts(src_staff):
-        new_row = Staff(
-            id=row["ID"],
-            name=row["FullName"]
-        )
-        db.session.add(new_row)
-    db.session.commit()
+
+def to_float(v):
+    v = to_text(v)
+    return float(v.replace('$', '').replace(',', '')) if v is not None else None
+
+
+def to_bool(v):
+    v = to_text(v)
+    if v is None:
+        return None
+    if v.lower() in ('1', '-1', 'true', 'yes', 'y'):
+        return True
+    if v.lower() in ('0', 'false', 'no', 'n'):
+        return False
+    raise ValueError("could not convert {0!r} to a boolean".format(v))
+
+
+# table column: (csv column, type coercion)
+supplier_columns = {
+    'id': ('ID', to_int),
+    'name': ('Company', to_text)
+}
+product_columns = {
+    'code': ('ProductCode', to_text),
+    'name': ('ProductName', to_text),
+    'list_price': ('StandardCost', to_float),
+    'selling_price': ('ListPrice', to_float),
+    'quantity_per_unit': ('QuantityPerUnit', to_int),
+    'description': ('Description', to_text),
+    'supplier_id': ('SupplierID', to_int),
+    'discontinued': ('Discontinued', to_bool)
+}
+tag_columns = {
+    'id': ('ID', to_int),
+    'name': ('Category', to_text)
+}
+staff_columns = {
+    'id': ('ID', to_int),
+    'name': ('FullName', to_text)
+}
+
+
+def coerce_rows(source, columns, errors):
+    """yields csv rows converted to table rows. Rows that can't be converted
+    are skipped, and recorded in `errors` as (source, line, message).
+    """
+    for line, row in enumerate(etl.dicts(source), start=2):
+        try:
+            rec = {}
+            for column, (src_column, coerce) in columns.items():
+                try:
+                    rec[column] = coerce(row[src_column])
+                except (ValueError, TypeError) as e:
+                    raise ValueError("{0}: {1}".format(src_column, e))
+            yield rec
+        except ValueError as e:
+            errors.append((source.source.filename, line, str(e)))
+
+
+def bulk_import(conn, source, table, columns, key, upsert=False, batch_size=1000):
+    """load a csv into a table in batches, using one executemany per batch.
+    In upsert mode, rows whose `key` already exists are updated in place
+    rather than inserted.
+
+    Arguments:
+        conn {Connection} -- database connection, inside a transaction
+        source {petl table} -- csv source
+        table {Table} -- table to load into
+        columns {dict} -- table column: (csv column, type coercion)
+        key {str} -- column that identifies a row, for upserts
+
+    Keyword Arguments:
+        upsert {bool} -- update existing rows instead of failing (default: {False})
+        batch_size {int} -- rows per executemany (default: {1000})
+
+    Returns:
+        [list] -- (source, line, message) for every row that was skipped
+    """
+    errors = []
+    insert = table.insert()
+    update = table.update()\
+        .where(table.c[key] == bindparam('_' + key))\
+        .values({c: bindparam('_' + c) for c in columns if c != key})
+
+    rows = coerce_rows(source, columns, errors)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        if upsert:
+            keys = [r[key] for r in batch if r[key] is not None]
+            existing = set(
+                r[0] for r in
+                conn.execute(select([table.c[key]]).where(table.c[key].in_(keys)))
+            )
+            updates = [
+                {'_' + c: v for c, v in r.items()}
+                for r in batch if r[key] in existing
+            ]
+            batch = [r for r in batch if r[key] not in existing]
+            if updates:
+                conn.execute(update, updates)
+        if batch:
+            conn.execute(insert, batch)
+    return errors
+
+
+def create_suppliers(conn, upsert=False):
+    return bulk_import(conn, src_suppliers, Supplier.__table__, supplier_columns, 'id', upsert)
+
+
+def create_products(conn, upsert=False):
+    return bulk_import(conn, src_products, Product.__table__, product_columns, 'code', upsert)
+
+
+def create_tags(conn, upsert=False):
+    return bulk_import(conn, src_tags, Tag.__table__, tag_columns, 'id', upsert)
+
+
+def create_staff(conn, upsert=False):
+    return bulk_import(conn, src_staff, Staff.__table__, staff_columns, 'id', upsert)
+
+
+imports = {
+    'suppliers': create_suppliers,
+    'tags': create_tags,
+    'products': create_products,
+    'staff': create_staff
+}
+
+
+def import_sources(names=None, upsert=False):
+    """load the source csvs in a single transaction. If any row fails a
+    database constraint, nothing is loaded.
+
+    Keyword Arguments:
+        names {list} -- which of `imports` to run; all of them if None
+        upsert {bool} -- update existing rows instead of failing (default: {False})
+
+    Returns:
+        [list] -- (source, line, message) for every row that was skipped
+    """
+    errors = []
+    with db.engine.begin() as conn:
+        for name, create in imports.items():
+            if names is None or name in names:
+                errors.extend(create(conn, upsert))
+    return errors
+
+
+def echo_import_errors(errors):
+    for (source, line, message) in errors:
+        click.echo("{0} line {1}: {2}".format(source, line, message), err=True)
+    click.echo("{0} row(s) skipped".format(len(errors)))
 
 #----------------------------------------------------------------------------#
 # DB CONFIG
@@ -73,10 +199,18 @@ def create_staff():
 
 
 def set_trigger_fullname(db_path):
+    """keep product.fullname in sync with the product and supplier columns
+    it is made from. Replaces any existing versions of these triggers, so it
+    also works as a migration for older databases.
+    """
     q1 = """
     CREATE TRIGGER product_update_fullname
-    AFTER UPDATE ON product
+    AFTER UPDATE OF name, list_price, selling_price, supplier_id ON product
     FOR EACH ROW
+    WHEN old.name IS NOT new.name
+        OR old.list_price IS NOT new.list_price
+        OR old.selling_price IS NOT new.selling_price
+        OR old.supplier_id IS NOT new.supplier_id
     BEGIN
         UPDATE product
         SET fullname = (SELECT supplier.name FROM supplier WHERE supplier.id = product.supplier_id) || ' | ' || name || ' | $' || list_price || ' list / $' || selling_price || ' selling price'
@@ -95,16 +229,24 @@ def set_trigger_fullname(db_path):
     """
     q3 = """
     CREATE TRIGGER update_supplier_update_product_fullname
-    AFTER UPDATE ON supplier
+    AFTER UPDATE OF name ON supplier
     FOR EACH ROW
+    WHEN old.name IS NOT new.name
     BEGIN
         UPDATE product
-        SET fullname = (SELECT supplier.name FROM supplier WHERE supplier.id = product.supplier_id) || ' | ' || product.name || ' | $' || product.list_price || ' list / $' || product.selling_price || ' selling price';
+        SET fullname = new.name || ' | ' || product.name || ' | $' || product.list_price || ' list / $' || product.selling_price || ' selling price'
+        WHERE product.supplier_id = new.id;
     END;
     """
     q4 = """UPDATE product SET fullname = (SELECT supplier.name FROM supplier WHERE supplier.id = product.supplier_id) || ' | ' || name || ' | $' || list_price || ' list / $' || selling_price || ' selling price';"""
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
+    for name in [
+        'product_update_fullname',
+        'product_insert_fullname',
+        'update_supplier_update_product_fullname'
+    ]:
+        c.execute("DROP TRIGGER IF EXISTS {0}".format(name))
     for each in [q1, q2, q3, q4]:
         c.execute(each)
     conn.commit()
@@ -157,6 +299,521 @@ def set_trigger_selling_price(db_path):
     conn.commit()
     conn.close()
 
+# per-sale amounts, stored on the sale itself (see set_trigger_sale_amounts).
+# `{r}` is the sale row (new, old, or a table alias). unit_cost is the
+# product's list price when the sale was recorded, so a later price change
+# doesn't rewrite past profits. These mirror calculate_profit and
+# calculate_gross_sales in project/app.py; tests/test_db_setup.py checks that
+# they agree.
+sale_unit_cost = "(SELECT product.list_price FROM product WHERE product.id = {r}.product_id)"
+sale_price = """(
+    CASE
+        WHEN IFNULL({r}.special_price, 0) != 0 THEN {r}.special_price
+        WHEN IFNULL({r}.sold_price, 0) != 0 THEN {r}.sold_price
+    END
+)"""
+sale_quantity = "(CASE WHEN IFNULL({r}.quantity, 0) = 0 THEN 1 ELSE {r}.quantity END)"
+sale_gross = "round(IFNULL(" + sale_price + ", IFNULL({r}.unit_cost, 0)) * " + sale_quantity + ", 2)"
+sale_profit = """(
+    CASE
+        WHEN """ + sale_price + """ IS NOT NULL
+            THEN round((""" + sale_price + " - IFNULL({r}.unit_cost, 0)) * " + sale_quantity + """, 2)
+        ELSE 0
+    END
+)"""
+
+
+def set_trigger_sale_amounts(db_path):
+    """store unit_cost, gross and profit on every sale, so that analytics can
+    add them up without joining product. The columns are added to older
+    databases and filled in for sales that don't have them yet. Replaces any
+    existing versions of these triggers, so it also works as a migration.
+    """
+    # unit_cost is set when a sale is recorded or moved to another product;
+    # setting it, or changing any of the prices or the quantity, updates
+    # gross and profit. sold_price is filled in by its own insert trigger, so
+    # whichever runs first, gross and profit end up right.
+    q1 = """
+    CREATE TRIGGER sale_insert_unit_cost
+    AFTER INSERT ON sale
+    FOR EACH ROW
+    BEGIN
+        UPDATE sale SET unit_cost = {0} WHERE id = new.id;
+    END;
+    """.format(sale_unit_cost.format(r='new'))
+    q2 = """
+    CREATE TRIGGER sale_update_product_unit_cost
+    AFTER UPDATE OF product_id ON sale
+    FOR EACH ROW
+    WHEN old.product_id IS NOT new.product_id
+    BEGIN
+        UPDATE sale SET unit_cost = {0} WHERE id = new.id;
+    END;
+    """.format(sale_unit_cost.format(r='new'))
+    q3 = """
+    CREATE TRIGGER sale_update_amounts
+    AFTER UPDATE OF quantity, special_price, sold_price, unit_cost ON sale
+    FOR EACH ROW
+    BEGIN
+        UPDATE sale SET gross = {0}, profit = {1} WHERE id = new.id;
+    END;
+    """.format(sale_gross.format(r='sale'), sale_profit.format(r='sale'))
+    # fill in existing sales before the triggers are created, in two passes
+    # since gross and profit depend on unit_cost
+    q4 = "UPDATE sale SET unit_cost = {0} WHERE gross IS NULL;".format(sale_unit_cost.format(r='sale'))
+    q5 = "UPDATE sale SET gross = {0}, profit = {1} WHERE gross IS NULL;".format(
+        sale_gross.format(r='sale'), sale_profit.format(r='sale')
+    )
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    existing = set(row[1] for row in c.execute("PRAGMA table_info(sale)"))
+    for name in ['unit_cost', 'gross', 'profit']:
+        if name not in existing:
+            c.execute("ALTER TABLE sale ADD COLUMN {0} FLOAT".format(name))
+    for name in [
+        'sale_insert_unit_cost',
+        'sale_update_product_unit_cost',
+        'sale_update_amounts'
+    ]:
+        c.execute("DROP TRIGGER IF EXISTS {0}".format(name))
+    for each in [q4, q5, q1, q2, q3]:
+        c.execute(each)
+    conn.commit()
+    conn.close()
+
+# per-sale contributions to the sales_daily rollup, from the amounts stored
+# on the sale
+rollup_day = "date({r}.date)"
+rollup_count = "IFNULL({r}.quantity, 1)"
+rollup_gross = "IFNULL({r}.gross, 0)"
+rollup_profit = "IFNULL({r}.profit, 0)"
+
+
+def rollup_apply(r, sign):
+    """returns statements that add (sign='+') or remove (sign='-') a sale
+    row's contribution to its sales_daily bucket, creating the bucket if
+    needed.
+    """
+    match = "day IS {0} AND product_id IS {1}.product_id AND staff_id IS {1}.staff_id".format(
+        rollup_day.format(r=r), r
+    )
+    return """
+        INSERT INTO sales_daily (day, product_id, staff_id, quantity, gross, profit)
+        SELECT {day}, {r}.product_id, {r}.staff_id, 0, 0, 0
+        WHERE {r}.product_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM sales_daily WHERE {match});
+        UPDATE sales_daily
+        SET quantity = quantity {sign} {count},
+            gross = gross {sign} {gross},
+            profit = profit {sign} {profit}
+        WHERE {match};
+    """.format(
+        r=r,
+        sign=sign,
+        match=match,
+        day=rollup_day.format(r=r),
+        count=rollup_count.format(r=r),
+        gross=rollup_gross.format(r=r),
+        profit=rollup_profit.format(r=r)
+    )
+
+
+def rollup_select(where):
+    """returns a query that aggregates sales into sales_daily rows
+    """
+    return """
+        SELECT {day}, s.product_id, s.staff_id, sum({count}), sum({gross}), sum({profit})
+        FROM sale s
+        WHERE s.product_id IS NOT NULL AND {where}
+        GROUP BY {day}, s.product_id, s.staff_id
+    """.format(
+        where=where,
+        day=rollup_day.format(r='s'),
+        count=rollup_count.format(r='s'),
+        gross=rollup_gross.format(r='s'),
+        profit=rollup_profit.format(r='s')
+    )
+
+
+def set_trigger_sales_daily(db_path):
+    """keep the sales_daily rollup in sync with the sale table. Safe to run
+    against a database that already has these triggers.
+    """
+    q1 = """
+    CREATE TRIGGER sales_daily_insert_sale
+    AFTER INSERT ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(rollup_apply('new', '+'))
+    q2 = """
+    CREATE TRIGGER sales_daily_update_sale
+    AFTER UPDATE OF quantity, date, gross, profit, product_id, staff_id ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+        {1}
+    END;
+    """.format(rollup_apply('old', '-'), rollup_apply('new', '+'))
+    q3 = """
+    CREATE TRIGGER sales_daily_delete_sale
+    AFTER DELETE ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(rollup_apply('old', '-'))
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    for name in [
+        'sales_daily_insert_sale',
+        'sales_daily_update_sale',
+        'sales_daily_delete_sale',
+        'sales_daily_update_product_list_price'
+    ]:
+        c.execute("DROP TRIGGER IF EXISTS {0}".format(name))
+    for each in [q1, q2, q3]:
+        c.execute(each)
+    conn.commit()
+    conn.close()
+
+
+def backfill_sales_daily(db_path):
+    """rebuild the sales_daily rollup from the full sales history. Reads the
+    amounts stored on each sale, so set_trigger_sale_amounts must have run.
+    """
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("DELETE FROM sales_daily")
+    c.execute(
+        "INSERT INTO sales_daily (day, product_id, staff_id, quantity, gross, profit) " +
+        rollup_select("1")
+    )
+    conn.commit()
+    conn.close()
+
+def inventory_apply(product_id, sold, replaced, initial='0'):
+    """returns statements that adjust a product's inventory row by the given
+    sold/replaced/initial volume amounts, creating the row if needed.
+    """
+    return """
+        INSERT OR IGNORE INTO inventory (product_id, in_stock, volume_sold, volume_replaced)
+        SELECT {product_id}, 0, 0, 0 WHERE {product_id} IS NOT NULL;
+        UPDATE inventory
+        SET volume_sold = volume_sold + ({sold}),
+            volume_replaced = volume_replaced + ({replaced}),
+            in_stock = in_stock + ({initial}) - ({sold}) + ({replaced})
+        WHERE product_id = {product_id};
+    """.format(product_id=product_id, sold=sold, replaced=replaced, initial=initial)
+
+
+def set_trigger_inventory(db_path):
+    """keep the inventory table in sync with products, sales and stock
+    receipts. Safe to run against a database that already has these triggers.
+    """
+    q1 = """
+    CREATE TRIGGER inventory_insert_product
+    AFTER INSERT ON product
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply('new.id', '0', '0', 'IFNULL(new.initial_volume, 0)'))
+    q2 = """
+    CREATE TRIGGER inventory_update_product_initial_volume
+    AFTER UPDATE OF initial_volume ON product
+    FOR EACH ROW
+    WHEN old.initial_volume IS NOT new.initial_volume
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply(
+        'new.id', '0', '0',
+        '(IFNULL(new.initial_volume, 0) - IFNULL(old.initial_volume, 0))'
+    ))
+    q3 = """
+    CREATE TRIGGER inventory_insert_sale
+    AFTER INSERT ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply('new.product_id', 'IFNULL(new.quantity, 1)', '0'))
+    q4 = """
+    CREATE TRIGGER inventory_update_sale
+    AFTER UPDATE OF quantity, product_id ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+        {1}
+    END;
+    """.format(
+        inventory_apply('old.product_id', '-IFNULL(old.quantity, 1)', '0'),
+        inventory_apply('new.product_id', 'IFNULL(new.quantity, 1)', '0')
+    )
+    q5 = """
+    CREATE TRIGGER inventory_delete_sale
+    AFTER DELETE ON sale
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply('old.product_id', '-IFNULL(old.quantity, 1)', '0'))
+    q6 = """
+    CREATE TRIGGER inventory_insert_stock
+    AFTER INSERT ON stock
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply('new.product_id', '0', 'IFNULL(new.units_purchased, 0)'))
+    q7 = """
+    CREATE TRIGGER inventory_update_stock
+    AFTER UPDATE OF units_purchased, product_id ON stock
+    FOR EACH ROW
+    BEGIN
+        {0}
+        {1}
+    END;
+    """.format(
+        inventory_apply('old.product_id', '0', '-IFNULL(old.units_purchased, 0)'),
+        inventory_apply('new.product_id', '0', 'IFNULL(new.units_purchased, 0)')
+    )
+    q8 = """
+    CREATE TRIGGER inventory_delete_stock
+    AFTER DELETE ON stock
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(inventory_apply('old.product_id', '0', '-IFNULL(old.units_purchased, 0)'))
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    for name in [
+        'inventory_insert_product',
+        'inventory_update_product_initial_volume',
+        'inventory_insert_sale',
+        'inventory_update_sale',
+        'inventory_delete_sale',
+        'inventory_insert_stock',
+        'inventory_update_stock',
+        'inventory_delete_stock'
+    ]:
+        c.execute("DROP TRIGGER IF EXISTS {0}".format(name))
+    for each in [q1, q2, q3, q4, q5, q6, q7, q8]:
+        c.execute(each)
+    conn.commit()
+    conn.close()
+
+
+def backfill_inventory(db_path):
+    """recalculate every product's inventory from its initial volume, sales
+    and stock receipts. Existing inventory notes are kept.
+    """
+    q1 = """
+    INSERT OR IGNORE INTO inventory (product_id, in_stock, volume_sold, volume_replaced)
+    SELECT id, 0, 0, 0 FROM product;
+    """
+    q2 = """
+    UPDATE inventory
+    SET volume_sold = IFNULL((
+            SELECT sum(IFNULL(sale.quantity, 1)) FROM sale
+            WHERE sale.product_id = inventory.product_id
+        ), 0),
+        volume_replaced = IFNULL((
+            SELECT sum(IFNULL(stock.units_purchased, 0)) FROM stock
+            WHERE stock.product_id = inventory.product_id
+        ), 0);
+    """
+    q3 = """
+    UPDATE inventory
+    SET in_stock = IFNULL((
+            SELECT product.initial_volume FROM product
+            WHERE product.id = inventory.product_id
+        ), 0) - volume_sold + volume_replaced;
+    """
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    for each in [q1, q2, q3]:
+        c.execute(each)
+    conn.commit()
+    conn.close()
+
+
+def product_search_refresh(where):
+    """SQL to rebuild the product_search entries for the products matching
+    `where` (a condition on the product table)
+    """
+    return """
+        DELETE FROM product_search WHERE rowid IN (SELECT id FROM product WHERE {0});
+        INSERT INTO product_search (rowid, name, code, fullname, supplier, tags)
+        SELECT product.id, product.name, product.code, product.fullname, supplier.name, (
+            SELECT group_concat(tag.name, ' ') FROM product_tags
+            JOIN tag ON tag.id = product_tags.tag_id
+            WHERE product_tags.product_id = product.id
+        )
+        FROM product LEFT JOIN supplier ON supplier.id = product.supplier_id
+        WHERE {0};
+    """.format(where)
+
+
+def set_product_search(db_path):
+    """(re)create product_search, an FTS5 full-text index of each product's
+    name, code, fullname, supplier and tags used by the Product and Sale
+    views' search, along with the triggers that keep it up to date, then
+    fill it from the product table. Safe to run on an existing database.
+    """
+    q1 = """
+    CREATE VIRTUAL TABLE product_search
+    USING fts5(name, code, fullname, supplier, tags, prefix='2 3');
+    """
+    q2 = """
+    CREATE TRIGGER product_search_insert_product
+    AFTER INSERT ON product
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh('product.id = new.id'))
+    q3 = """
+    CREATE TRIGGER product_search_update_product
+    AFTER UPDATE OF name, code, fullname, supplier_id ON product
+    FOR EACH ROW
+    WHEN old.name IS NOT new.name
+        OR old.code IS NOT new.code
+        OR old.fullname IS NOT new.fullname
+        OR old.supplier_id IS NOT new.supplier_id
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh('product.id = new.id'))
+    q4 = """
+    CREATE TRIGGER product_search_delete_product
+    AFTER DELETE ON product
+    FOR EACH ROW
+    BEGIN
+        DELETE FROM product_search WHERE rowid = old.id;
+    END;
+    """
+    q5 = """
+    CREATE TRIGGER product_search_update_supplier
+    AFTER UPDATE OF name ON supplier
+    FOR EACH ROW
+    WHEN old.name IS NOT new.name
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh('product.supplier_id = new.id'))
+    q6 = """
+    CREATE TRIGGER product_search_update_tag
+    AFTER UPDATE OF name ON tag
+    FOR EACH ROW
+    WHEN old.name IS NOT new.name
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh(
+        'product.id IN (SELECT product_id FROM product_tags WHERE tag_id = new.id)'
+    ))
+    q7 = """
+    CREATE TRIGGER product_search_delete_tag
+    AFTER DELETE ON tag
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh(
+        'product.id IN (SELECT product_id FROM product_tags WHERE tag_id = old.id)'
+    ))
+    q8 = """
+    CREATE TRIGGER product_search_insert_product_tags
+    AFTER INSERT ON product_tags
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh('product.id = new.product_id'))
+    q9 = """
+    CREATE TRIGGER product_search_delete_product_tags
+    AFTER DELETE ON product_tags
+    FOR EACH ROW
+    BEGIN
+        {0}
+    END;
+    """.format(product_search_refresh('product.id = old.product_id'))
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    for name in [
+        'product_search_insert_product',
+        'product_search_update_product',
+        'product_search_delete_product',
+        'product_search_update_supplier',
+        'product_search_update_tag',
+        'product_search_delete_tag',
+        'product_search_insert_product_tags',
+        'product_search_delete_product_tags'
+    ]:
+        c.execute("DROP TRIGGER IF EXISTS {0}".format(name))
+    c.execute("DROP TABLE IF EXISTS product_search")
+    for each in [q1, q2, q3, q4, q5, q6, q7, q8, q9]:
+        c.execute(each)
+    c.executescript(product_search_refresh('1'))
+    conn.commit()
+    conn.close()
+
+
+def create_columns():
+    """add any columns declared on the models that an existing table is
+    missing, e.g. sale.receipt_id. SQLite can only add columns that may be
+    NULL, so they start out empty. Tables and data are left as they are.
+
+    Returns:
+        [list] -- table.column for each column that was added
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not db.engine.has_table(table.name):
+            continue
+        existing = set(c['name'] for c in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = "ALTER TABLE {0} ADD COLUMN {1} {2}".format(
+                preparer.format_table(table),
+                preparer.format_column(column),
+                column.type.compile(dialect=db.engine.dialect)
+            )
+            for fk in column.foreign_keys:
+                ddl += " REFERENCES {0} ({1})".format(
+                    preparer.format_table(fk.column.table), preparer.format_column(fk.column)
+                )
+            db.engine.execute(ddl)
+            created.append("{0}.{1}".format(table.name, column.name))
+    return created
+
+
+def create_indexes():
+    """create any indexes declared on the models that an existing database
+    is missing. Tables and data are left as they are.
+
+    Returns:
+        [list] -- names of the indexes that were created
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not db.engine.has_table(table.name):
+            continue
+        existing = set(ix['name'] for ix in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
 #----------------------------------------------------------------------------#
 # CREATE SOME DATA
 #----------------------------------------------------------------------------#
@@ -165,16 +822,98 @@ def set_trigger_selling_price(db_path):
 def build_db():
     # build tables from source data
     print(app.config)
-    create_suppliers()
-    create_tags()
-    create_products()
-    create_staff()
+    echo_import_errors(import_sources())
     # set triggers
     set_trigger_fullname(db_path)
     set_trigger_selling_price(db_path)
+    set_trigger_sale_amounts(db_path)
+    set_trigger_sales_daily(db_path)
+    set_trigger_inventory(db_path)
+    backfill_inventory(db_path)
+    set_product_search(db_path)
 
 
-if __name__ == '__main__':
-    db.drop_all()
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx):
+    """builds the database from the source data (dropping any existing
+    tables), or runs one of the maintenance commands on an existing one.
+    """
+    if ctx.invoked_subcommand is None:
+        db.drop_all()
+        db.create_all()
+        build_db()
+
+
+@cli.command('import')
+@click.option('--upsert', is_flag=True, help='update rows that already exist')
+@click.option('--only', multiple=True, type=click.Choice(list(imports)),
+              help='import just these sources (repeatable)')
+def import_command(upsert, only):
+    """loads the csvs in sources/ into an existing database, e.g. to
+    re-import a supplier price list with `import --upsert --only products`.
+    """
+    try:
+        errors = import_sources(names=only or None, upsert=upsert)
+    except IntegrityError as e:
+        raise click.ClickException(
+            "nothing imported: {0} (use --upsert to update existing rows)".format(e.orig)
+        )
+    echo_import_errors(errors)
+
+
+@cli.command('backfill-rollup')
+def backfill_rollup():
+    """adds the sales_daily rollup table and triggers to an existing
+    database, and fills it from the sales history.
+    """
+    # only this command's table, if it doesn't exist yet; the others are
+    # created along with their triggers by their own commands
+    SalesDaily.__table__.create(db.engine, checkfirst=True)
+    set_trigger_sale_amounts(db_path)
+    set_trigger_sales_daily(db_path)
+    backfill_sales_daily(db_path)
+    click.echo("sales_daily rebuilt: {0}".format(db_path))
+
+
+@cli.command('backfill-inventory')
+def backfill_inventory_command():
+    """adds the stock and inventory tables and triggers to an existing
+    database, and calculates current inventory from the sales history.
+    """
+    # only this command's tables, if they don't exist yet; an empty
+    # sales_daily (without its triggers) would pass for the rollup
+    Stock.__table__.create(db.engine, checkfirst=True)
+    Inventory.__table__.create(db.engine, checkfirst=True)
+    set_trigger_inventory(db_path)
+    backfill_inventory(db_path)
+    click.echo("inventory rebuilt: {0}".format(db_path))
+
+
+@cli.command('upgrade')
+def upgrade():
+    """brings an existing database up to date with the models, adding
+    missing tables, columns and indexes, replacing the fullname, sale amount,
+    rollup and inventory triggers, and rebuilding the rollup, inventory and
+    product search index, without dropping any data. Safe to run more than
+    once.
+    """
+    # only creates tables that don't exist yet
     db.create_all()
-    build_db()
+    for name in create_columns():
+        click.echo("added column {0}".format(name))
+    # fills in the sale amount columns, before they are indexed
+    set_trigger_sale_amounts(db_path)
+    for name in create_indexes():
+        click.echo("created index {0}".format(name))
+    set_trigger_fullname(db_path)
+    set_trigger_sales_daily(db_path)
+    backfill_sales_daily(db_path)
+    set_trigger_inventory(db_path)
+    backfill_inventory(db_path)
+    set_product_search(db_path)
+    click.echo("upgraded: {0}".format(db_path))
+
+
+if __name__ == '__main__':
+    cli()
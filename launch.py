@@ -1,41 +1,64 @@
-from threading import Thread, Lock
+from threading import Thread, Event
 import logging
-import webview
-from time import sleep
-from project.app import app
 
-server_lock = Lock()
+HOST = "127.0.0.1"
+PORT = 23948
 
 logger = logging.getLogger(__name__)
 
 
-def url_ok(url, port):
-    from http.client import HTTPConnection
+class ServerThread(Thread):
+    """runs the app's server in the background. `ready` is set as soon as
+    the server's socket is bound (connections made from then on are queued
+    until it starts serving), or if it fails to start, in which case `error`
+    holds the exception. The app itself is imported in this thread, so the
+    caller can get on with other work meanwhile.
+    """
 
-    try:
-        conn = HTTPConnection(url, port)
-        conn.request("GET", "/")
-        r = conn.getresponse()
-        return r.status == 200
-    except:
-        logger.exception("Server not started")
-        return False
+    def __init__(self, host=HOST, port=PORT):
+        Thread.__init__(self)
+        self.daemon = True
+        self.host = host
+        self.port = port
+        self.ready = Event()
+        self.error = None
+        self.server = None
 
+    def run(self):
+        try:
+            from werkzeug.serving import make_server
+            from project.app import app
+            self.server = make_server(self.host, self.port, app, threaded=True)
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.ready.set()
+        self.server.serve_forever()
 
-def run_server():
-    app.run(host="127.0.0.1", port=23948, threaded=True, debug=False)
+    def wait(self, timeout=None):
+        """block until the server is accepting connections
 
+        Raises:
+            the server's exception if it failed to start
+        """
+        self.ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
 
-if __name__ == '__main__':
-    logger.debug("Starting server")
-    t = Thread(target=run_server)
-    t.daemon = True
-    t.start()
-    logger.debug("Checking server")
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(self.host, self.port)
 
-    while not url_ok("127.0.0.1", 23948):
-        sleep(0.1)
 
+if __name__ == '__main__':
+    logger.debug("Starting server")
+    server = ServerThread()
+    server.start()
+    import webview
+    server.wait()
     logger.debug("Server started")
+
+    from project.app import app
     webview.create_window(
-        app.config['APP_TITLE'], "http://127.0.0.1:23948", min_size=(320, 240), fullscreen=False)
+        app.config['APP_TITLE'], server.url, min_size=(320, 240), fullscreen=False)
@@ -3,20 +3,31 @@
 # Imports
 # ----------------------------------------------------------------------------
 
-import os
-import time
+import re
+import io
+import csv
 import sqlite3
 import logging
 import operator
-import json
 import datetime
-from flask import Flask, redirect, render_template, url_for
+import heapq
+import itertools
+import functools
+import math
+from collections import OrderedDict
+from flask import Flask, Response, abort, flash, has_request_context, jsonify, make_response, redirect, render_template, request, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select, func, and_, or_, false, literal, literal_column, tuple_, type_coerce, table, column
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import object_session, joinedload, load_only, subqueryload
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import UnaryExpression
 from sqlalchemy.schema import FetchedValue
+from sqlalchemy.types import NullType
 from jinja2 import Markup
+from werkzeug.http import is_resource_modified
 from wtforms import validators
-import petl as etl
-from dateutil.parser import parse
 
 import flask_admin as admin
 from flask_admin.contrib import sqla
@@ -25,20 +36,143 @@ from flask_admin.contrib.sqla import ModelView
 from flask_admin.form import rules
 from flask_admin import BaseView, expose
 
+from project.utils.cache import SummaryCache
+from project.utils.httpcache import Compressor, DataVersion, StaticFingerprints
+from project.utils.profiler import QueryProfiler
+from project.utils.timing import Timings
+
 # ----------------------------------------------------------------------------
 # Application Setup
 # ----------------------------------------------------------------------------
 
+# SQLite settings for every new connection, in the order they're applied.
+# Override any of them in config.py with SQLITE_PRAGMAS (None leaves SQLite's
+# default in place).
+SQLITE_PRAGMAS = OrderedDict([
+    # wait this many ms for a lock rather than failing straight away
+    ('busy_timeout', 5000),
+    # readers don't block the writer, or the writer readers
+    ('journal_mode', 'WAL'),
+    # safe with WAL; only syncs at checkpoints
+    ('synchronous', 'NORMAL'),
+    # page cache per connection, in KiB when negative
+    ('cache_size', -16000),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'MEMORY')
+])
+
+
+class Database(SQLAlchemy):
+    def apply_driver_hacks(self, app, info, options):
+        """Flask-SQLAlchemy opens a new connection for each session on an
+        SQLite file. Instead, keep a pool of SQLITE_POOL_SIZE connections
+        (plus up to SQLITE_MAX_OVERFLOW more when busy) shared between the
+        server's threads, so the pragmas are only run once per connection.
+        """
+        super(Database, self).apply_driver_hacks(app, info, options)
+        pool_size = app.config.get('SQLITE_POOL_SIZE', 5)
+        if options.get('poolclass') is NullPool and pool_size:
+            options['poolclass'] = QueuePool
+            options['pool_size'] = pool_size
+            options['max_overflow'] = app.config.get('SQLITE_MAX_OVERFLOW', 10)
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    pragmas = OrderedDict(SQLITE_PRAGMAS)
+    pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+    cursor = dbapi_connection.cursor()
+    for (name, value) in pragmas.items():
+        if value is not None:
+            cursor.execute("PRAGMA {0} = {1}".format(name, value))
+    cursor.close()
+
+
 # Create application
 app = Flask(__name__)
 app.config.from_pyfile('config.py')
-db = SQLAlchemy(app)
+db = Database(app)
+event.listen(Engine, 'connect', set_sqlite_pragmas)
 
 # setup logging for SQLAlchemy
 if app.config['SQLALCHEMY_LOGGING']:
     logging.basicConfig()
     logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
+# opt-in SQL profiler, shown at /admin/profiler/. Unless SQL_PROFILER is set,
+# nothing is hooked up, so it costs nothing.
+query_profiler = None
+if app.config.get('SQL_PROFILER'):
+    query_profiler = QueryProfiler(
+        slow_ms=app.config.get('SQL_PROFILER_SLOW_MS', 100),
+        max_statements=app.config.get('SQL_PROFILER_MAX_STATEMENTS', 500)
+    )
+    query_profiler.install(Engine)
+    app.before_request(query_profiler.count_request)
+
+# opt-in request and stage timings, shown at /admin/timings/ and in each
+# response's Server-Timing header. Unless TIMING is set, timings.span() does
+# nothing and no request hooks are installed.
+timings = Timings(
+    window=app.config.get('TIMING_WINDOW', 1000),
+    server_timing=app.config.get('TIMING_HEADER', True)
+)
+if app.config.get('TIMING'):
+    timings.init_app(app)
+
+# in-memory cache of analytics results, cleared whenever sales, products,
+# suppliers, tags or staff are changed (see "Analytics cache invalidation"
+# below), or the database is changed from outside the app (see data_version)
+summary_cache = SummaryCache(
+    max_entries=app.config.get('ANALYTICS_CACHE_ENTRIES', 32),
+    max_bytes=app.config.get('ANALYTICS_CACHE_BYTES', 16 * 1024 * 1024)
+)
+
+# row counts and page boundaries for the keyset-paginated list views; cleared
+# along with summary_cache
+page_cache = SummaryCache(
+    max_entries=app.config.get('PAGE_CACHE_ENTRIES', 1024),
+    max_bytes=app.config.get('PAGE_CACHE_BYTES', 1024 * 1024)
+)
+
+
+def clear_caches():
+    summary_cache.clear()
+    page_cache.clear()
+
+
+# ETags for the analytics data, from SQLite's data_version, so unchanged
+# data is answered with a 304 (see conditional() below). Changes committed by
+# anything else, e.g. db_setup.py, a restore or another process, are noticed
+# too, and clear the caches.
+data_version = DataVersion(on_change=clear_caches)
+
+
+def check_data_version():
+    """check for changes before every request, so that no cached page or
+    summary outlives a change made outside the app
+    """
+    if request.endpoint != 'static':
+        data_version.check(db.engine.url.database)
+
+
+app.before_request(check_data_version)
+
+# gzip/brotli compression of text responses
+compressor = Compressor(
+    min_size=app.config.get('COMPRESS_MIN_SIZE', 500),
+    level=app.config.get('COMPRESS_LEVEL', 6)
+)
+if app.config.get('COMPRESS', True):
+    compressor.init_app(app)
+
+# static files are linked with a hash of their contents (?v=...), and cached
+# by the browser for STATIC_MAX_AGE seconds
+static_fingerprints = StaticFingerprints(max_age=app.config.get('STATIC_MAX_AGE', 365 * 24 * 60 * 60))
+static_fingerprints.init_app(app)
+
 # ----------------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------------
@@ -59,7 +193,11 @@ def format_date(date_string, strf_string='%Y-%m-%d', replace_nonetype_with="00-0
     #     print(date_string, type(date_string))
     #     return replace_nonetype_with
     # else:
-    dt = parse(date_string)
+    if isinstance(date_string, datetime.date):
+        dt = date_string
+    else:
+        # dates are stored by SQLite as "YYYY-MM-DD HH:MM:SS.ffffff"
+        dt = datetime.datetime.strptime(date_string[:10], '%Y-%m-%d')
     return dt.strftime(strf_string)
 
 
@@ -128,6 +266,15 @@ def calculate_gross_sales(rec, assume_quantity=1):
         return 0
 
 
+GRANULARITIES = ('day', 'week', 'month', 'year')
+RANKINGS = ('product', 'supplier', 'tag')
+METRICS = ('units', 'gross', 'profit')
+# line items a single receipt (see record_receipt) can have, and blank rows
+# on the checkout form
+MAX_RECEIPT_LINES = 1000
+CHECKOUT_FORM_LINES = 10
+
+
 def handle_none(v, replace_with=1):
     if v is None:
         return replace_with
@@ -135,138 +282,997 @@ def handle_none(v, replace_with=1):
         return v
 
 
-def export_data(table):
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    print(dir_path)
-    outpath = os.path.join(dir_path, 'static', 'data', "sales.csv")
+def parse_date_arg(name, end_of_day=False):
+    """read an optional YYYY-MM-DD date from the request's query string.
+    Aborts with a 400 if it can't be read.
+
+    Keyword Arguments:
+        end_of_day {bool} -- return the last moment of the day rather than
+            midnight, so the whole day is included in a range (default: {False})
+    """
+    v = request.args.get(name)
+    if not v:
+        return None
+    try:
+        dt = datetime.datetime.strptime(v, '%Y-%m-%d')
+    except ValueError:
+        abort(400)
+    if end_of_day:
+        dt = dt.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return dt
+
+
+def conditional(view):
+    """answers a view with a 304 Not Modified, without running it, if the
+    client's copy (by its ETag) is from the current version of the database.
+    Otherwise the response carries the ETag for next time, and the client is
+    told to check back with it before reusing it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = data_version.check(db.engine.url.database)
+        if etag is None:
+            return view(*args, **kwargs)
+        if is_resource_modified(request.environ, etag=etag):
+            response = make_response(view(*args, **kwargs))
+        else:
+            response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+
+def export_data(start_dt=None, end_dt=None, staff_id=None, chunk_size=1000):
+    """generates the sales data as CSV text, a chunk of rows at a time, so
+    that memory use doesn't grow with the size of the sale table.
+
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this datetime (default: {None})
+        end_dt {datetime} -- sales on or before this datetime (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        chunk_size {int} -- number of rows fetched and written per chunk (default: {1000})
+
+    Yields:
+        [str] -- CSV text, starting with the header row
+    """
+    conn = db.engine.connect().execution_options(stream_results=True)
+    try:
+        result = conn.execute(
+            sales_query(
+                start_dt=start_dt,
+                end_dt=end_dt,
+                staff_id=staff_id,
+                granularity='day',
+                ordered=True
+            )
+        )
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(list(result.keys()))
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                rec = dict(row)
+                rec['quantity'] = handle_none(rec['quantity'], replace_with=1)
+                writer.writerow(list(rec.values()))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        conn.close()
+
+
+def aggregate_sales(records):
+    """tally up totals and the per-day chart series in a single pass over
+    prepped sales records (i.e., records that already have `profit` and
+    `gross_sales` fields).
+
+    Arguments:
+        records {iterable} -- sales records, as dicts
+
+    Returns:
+        [dict] -- totals, per-day series, and totals for sales with no date
+    """
+    gross_sales = 0
+    profits = 0
+    # per-day sums, keyed by date string. sales without a date go in None.
+    count = {}
+    gross = {}
+    profit = {}
+
+    for rec in records:
+        d = rec['date']
+        profits += rec['profit']
+        gross_sales += rec['gross_sales']
+        count[d] = count.get(d, 0) + rec['quantity']
+        gross[d] = gross.get(d, 0) + rec['gross_sales']
+        profit[d] = profit.get(d, 0) + rec['profit']
+
+    def series(sums):
+        return [{'x': k, 'y': sums[k]} for k in sorted(k for k in sums if k is not None)]
+
+    def missing(sums):
+        return [{'x': None, 'y': sums[None]}] if None in sums else []
+
+    return {
+        'gross_sales': gross_sales,
+        'profits': profits,
+        'chart_gross': series(gross),
+        'chart_gross_missing_date': missing(gross),
+        'chart_profit': series(profit),
+        'chart_profit_missing_date': missing(profit),
+        'chart_count': series(count),
+        'chart_count_missing_date': missing(count)
+    }
+
+
+def period_expression(column, granularity='day'):
+    """SQL expression for the first day (YYYY-MM-DD) of the day, week, month
+    or year that a date column falls in. Weeks start on Monday.
+    """
+    if granularity == 'day':
+        return func.date(column)
+    if granularity == 'week':
+        # forward to Sunday (unless already there), then back to Monday
+        return func.date(column, 'weekday 0', '-6 days')
+    if granularity == 'month':
+        return func.strftime('%Y-%m-01', column)
+    if granularity == 'year':
+        return func.strftime('%Y-01-01', column)
+    raise ValueError("granularity must be one of {0}".format(', '.join(GRANULARITIES)))
+
+
+def filter_sales(query, start_dt=None, end_dt=None, staff_id=None):
+    """add date range and staff filters on sale to a query
+    """
+    sale = Sale.__table__
+    if start_dt:
+        query = query.where(sale.c.date >= start_dt)
+    if end_dt:
+        query = query.where(sale.c.date <= end_dt)
+    if staff_id:
+        query = query.where(sale.c.staff_id == staff_id)
+    return query
+
+
+def sales_query(start_dt=None, end_dt=None, staff_id=None, granularity=None, ordered=False):
+    """build a query that joins product and staff info to sales records,
+    filtered by date range and staff member. Filters are sent to the
+    database as parameters of the WHERE clause. Each sale's unit cost,
+    profit and gross sales come last.
+
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this datetime (default: {None})
+        end_dt {datetime} -- sales on or before this datetime (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        granularity {str} -- if given, the date column is replaced with the
+            first day of its day/week/month/year, worked out by the database
+            (default: {None})
+        ordered {bool} -- sort by date (then id) in the database (default: {False})
+
+    Returns:
+        [sqlalchemy.sql.Select] -- the query, ready to be executed
+    """
+    sale = Sale.__table__
+    product = Product.__table__
+    staff = Staff.__table__
+
+    amounts = [sale.c.unit_cost, sale.c.profit, sale.c.gross.label('gross_sales')]
+    sale_columns = [c for c in sale.c if c.name not in ('unit_cost', 'profit', 'gross')]
+    if granularity is not None:
+        sale_columns = [
+            period_expression(c, granularity).label('date') if c is sale.c.date else c
+            for c in sale_columns
+        ]
+
+    query = select(sale_columns + [
+        product.c.code,
+        product.c.name,
+        product.c.fullname,
+        product.c.list_price,
+        product.c.selling_price,
+        product.c.supplier_id,
+        staff.c.name.label('staff_name')
+    ] + amounts).select_from(
+        sale
+        .join(product, sale.c.product_id == product.c.id)
+        .outerjoin(staff, sale.c.staff_id == staff.c.id)
+    )
+    query = filter_sales(query, start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+
+    if ordered:
+        query = query.order_by(sale.c.date, sale.c.id)
+
+    return query
+
+
+def sale_amounts_query(start_dt=None, end_dt=None, staff_id=None, granularity='day', ordered=False):
+    """build a query for the date, units sold, gross sales and profit of
+    each sale, read from the amounts stored on the sale (see
+    set_trigger_sale_amounts in db_setup.py), so product isn't joined and
+    the ix_sale_amounts index covers it. Like sales_query, sales with no
+    product are left out.
+
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this datetime (default: {None})
+        end_dt {datetime} -- sales on or before this datetime (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        granularity {str} -- 'day', 'week', 'month' or 'year'; the date is the
+            first day of the period (default: {'day'})
+        ordered {bool} -- sort by date in the database (default: {False})
 
-    etl.tocsv(table, outpath)
+    Returns:
+        [sqlalchemy.sql.Select] -- the query, ready to be executed
+    """
+    sale = Sale.__table__
+    query = select([
+        period_expression(sale.c.date, granularity).label('date'),
+        func.ifnull(sale.c.quantity, 1).label('quantity'),
+        sale.c.gross.label('gross_sales'),
+        sale.c.profit
+    ]).where(sale.c.product_id.isnot(None))
+    query = filter_sales(query, start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+
+    if ordered:
+        query = query.order_by(sale.c.date)
+
+    return query
 
 
-def sales_summary(start_dt=None, end_dt=None, staff_id=None, for_export=False):
+def sales_summary(start_dt=None, end_dt=None, staff_id=None, for_export=False, granularity='day'):
     """tally up gross (sale over list) profits
     TODO: tally up net profites (gross profit vs inventory purchase total)
 
-    TODO: Keyword Arguments:
-        start_dt {[type]} -- datetime for start of query (default: {None})
-        end_dt {[type]} -- datetime for start of query [description] (default: {None})
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this datetime (default: {None})
+        end_dt {datetime} -- sales on or before this datetime (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        for_export {bool} -- return totals and the prepped table instead (default: {False})
+        granularity {str} -- 'day', 'week', 'month' or 'year'; charts are keyed
+            by the first day of each period (default: {'day'})
 
     Returns:
         [dict] -- various types of sales information, stored in a dictionary.
     """
 
-    # products = db.session.query(Product).all()
-    # sales = db.session.query(Sale).all()
-
-    # retrieve existing tables
-    products_records = etl.fromdb(db.engine, 'SELECT * FROM product')
-    sales_records = etl.fromdb(db.engine, 'SELECT * FROM sale')
-    staff_records = etl.fromdb(db.engine, 'SELECT * FROM staff')
-    
-    # filter by start/end date if provided
-    if start_dt and end_dt:
-        sales_records = etl\
-            .selectnotnone(sales_records, 'date')\
-            .select(lambda r: r.date > start_dt and r.date <= end_dt)
-    elif start_dt and not end_dt:
-        sales_records = etl\
-            .selectnotnone(sales_records, 'date')\
-            .select(lambda r: r.date > start_dt)
-    elif end_dt and not start_dt:
-        sales_records = etl\
-            .selectnotnone(sales_records, 'date')\
-            .select(lambda r: r.date <= end_dt)
-    else:
-        pass
-    
-    # filter by staff id if provided
-    if staff_id:
-        sales_records = etl.select(sales_records, 'staff_id', lambda v: v == staff_id)
-
-    # join product info to sales data
-    sales_data = etl\
-        .join(
-            sales_records,
-            products_records,
-            lkey='product_id', 
-            rkey='id'
-        )\
-        .leftjoin(
-            staff_records,
-            lkey='staff_id',
-            rkey='id'
+    import petl as etl
+
+    # retrieve the date, units, gross sales and profit of each sale. date and
+    # staff filters are applied by the database, so only matching rows come
+    # back, with each date already bucketed by day/week/month/year, in date
+    # order.
+    sales_data = etl.fromdb(
+        db.engine,
+        sale_amounts_query(
+            start_dt=start_dt,
+            end_dt=end_dt,
+            staff_id=staff_id,
+            granularity=granularity,
+            ordered=True
         )
-            
-
-    # prep joined sales data for tabulation
-    sales_data = etl\
-        .convert(sales_data, 'date', lambda dt: format_date(dt))\
-        .sort('date')\
-        .convert('quantity', lambda q: handle_none(q, replace_with=1))\
-        .addfield('profit', lambda rec: calculate_profit(rec))\
-        .addfield('gross_sales', lambda rec: calculate_gross_sales(rec))
-        
-    # tabulate some figures
-    gross_sales = 0
-    profits = 0
-    for sale in etl.dicts(sales_data):
-        profits += calculate_profit(sale)
-        gross_sales += calculate_gross_sales(sale)
+    )
+
+    # tabulate totals and summarize data into charting-friendly data
+    # structures. The table is lazy, so rows are fetched as they're
+    # aggregated and fetching and aggregating are timed together.
+    with timings.span('sales.summary'):
+        summary = aggregate_sales(etl.dicts(sales_data))
 
     if for_export:
         return {
-            'gross_sales': gross_sales,
-            'profits': profits, 
+            'gross_sales': summary['gross_sales'],
+            'profits': summary['profits'],
             'table': sales_data
-        }       
+        }
+    return summary
 
-    export_data(sales_data)
 
-    # summarize data into charting-friendly data structures
-    chart_count, chart_count_missing_date = etl\
-        .fold(sales_data, 'date', operator.add, 'quantity', presorted=True)\
-        .rename({'key': 'x', 'value': 'y'})\
-        .biselect(lambda rec: rec.x is not None)
-        
-    # print(chart_count)
-    # etl.lookall(chart_count)
+def daily_sales_summary(start_dt=None, end_dt=None, staff_id=None, granularity='day'):
+    """same as sales_summary, but read from the sales_daily rollup table, so
+    the cost depends on the number of days with sales rather than the number
+    of sales. Date filters apply to whole days.
 
-    chart_gross, chart_gross_missing_date = etl\
-        .fold(sales_data, 'date', operator.add,'gross_sales', presorted=True)\
-        .rename({'key': 'x', 'value': 'y'})\
-        .biselect(lambda rec: rec.x is not None)
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this day (default: {None})
+        end_dt {datetime} -- sales on or before this day (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        granularity {str} -- 'day', 'week', 'month' or 'year' (default: {'day'})
 
-    # print(chart_gross)
-    # etl.lookall(chart_gross)
+    Returns:
+        [dict] -- various types of sales information, stored in a dictionary.
+    """
+    rollup = SalesDaily.__table__
+    period = period_expression(rollup.c.day, granularity)
+    query = select([
+        period.label('date'),
+        func.sum(rollup.c.quantity).label('quantity'),
+        func.sum(rollup.c.gross).label('gross_sales'),
+        func.sum(rollup.c.profit).label('profit')
+    ]).group_by(period)
+    query = filter_rollup(query, start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+
+    with timings.span('rollup.fetch'):
+        rows = db.engine.execute(query).fetchall()
+    with timings.span('rollup.aggregate'):
+        return aggregate_sales(rows)
+
+
+def filter_rollup(query, start_dt=None, end_dt=None, staff_id=None):
+    """add whole-day date and staff filters on sales_daily to a query
+    """
+    rollup = SalesDaily.__table__
+    if start_dt:
+        query = query.where(rollup.c.day >= format_date(start_dt))
+    if end_dt:
+        query = query.where(rollup.c.day <= format_date(end_dt))
+    if staff_id:
+        query = query.where(rollup.c.staff_id == staff_id)
+    return query
 
-    chart_profit, chart_profit_missing_date = etl\
-        .fold(sales_data, 'date', operator.add, 'profit', presorted=True)\
-        .rename({'key': 'x', 'value': 'y'})\
-        .biselect(lambda rec: rec.x is not None)
 
+# triggers that keep sales_daily in sync with the sale table (see
+# set_trigger_sales_daily in db_setup.py)
+ROLLUP_TRIGGERS = ('sales_daily_insert_sale', 'sales_daily_update_sale', 'sales_daily_delete_sale')
 
 
-    # for i in etl.dicts(chart_count):
-    #     print(i)
-    # for i in etl.dicts(chart_gross):
-    #     print(i)
-    
-    return {
-        'gross_sales': gross_sales,
-        'profits': profits,
-        'chart_gross': list(etl.dicts(chart_gross)),
-        'chart_gross_missing_date': list(etl.dicts(chart_gross_missing_date)),
-        'chart_profit': list(etl.dicts(chart_profit)),
-        'chart_profit_missing_date': list(etl.dicts(chart_profit_missing_date)),
-        'chart_count': list(etl.dicts(chart_count)),
-        'chart_count_missing_date': list(etl.dicts(chart_count_missing_date))
+def has_rollup():
+    """whether the database has the sales_daily rollup and its triggers. The
+    table alone isn't enough: db.create_all() creates it empty, and it's only
+    filled in and kept up to date once `db_setup.py backfill-rollup` (or
+    `upgrade`) has run.
+    """
+    found = db.engine.execute(
+        select([func.count()]).select_from(table('sqlite_master'))
+        .where(and_(column('type') == 'trigger', column('name').in_(ROLLUP_TRIGGERS)))
+    ).scalar()
+    return found == len(ROLLUP_TRIGGERS)
+
+
+def analytics_summary(start_dt=None, end_dt=None, staff_id=None, granularity='day'):
+    """sales summary for the analytics views, served from summary_cache when
+    possible. Summaries come from the sales_daily rollup if the database has
+    it (see has_rollup), and otherwise from sales_summary.
+
+    Keyword Arguments:
+        start_dt {datetime} -- sales on or after this datetime (default: {None})
+        end_dt {datetime} -- sales on or before this datetime (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        granularity {str} -- 'day', 'week', 'month' or 'year' (default: {'day'})
+
+    Returns:
+        [dict] -- various types of sales information, stored in a dictionary.
+    """
+    def compute():
+        if has_rollup():
+            return daily_sales_summary(
+                start_dt=start_dt, end_dt=end_dt, staff_id=staff_id, granularity=granularity
+            )
+        # database predates the rollup (see `db_setup.py backfill-rollup`)
+        return sales_summary(
+            start_dt=start_dt, end_dt=end_dt, staff_id=staff_id, granularity=granularity
+        )
+
+    return summary_cache.get_or_compute((start_dt, end_dt, staff_id, granularity), compute)
+
+
+def top_sellers(by='product', metric='gross', n=10, start_dt=None, end_dt=None, staff_id=None):
+    """rank products, suppliers or tags by units sold, gross sales or profit,
+    returning only the top n. Served from summary_cache when possible.
+
+    Keyword Arguments:
+        by {str} -- 'product', 'supplier' or 'tag' (default: {'product'})
+        metric {str} -- 'units', 'gross' or 'profit' (default: {'gross'})
+        n {int} -- how many to return (default: {10})
+        start_dt {datetime} -- sales on or after this day (default: {None})
+        end_dt {datetime} -- sales on or before this day (default: {None})
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+
+    Returns:
+        [list] -- dicts with id, name, units, gross and profit, best first
+    """
+    def compute():
+        if has_rollup():
+            return top_sellers_from_rollup(by, metric, n, start_dt, end_dt, staff_id)
+        # database predates the rollup (see `db_setup.py backfill-rollup`)
+        return top_sellers_from_sales(by, metric, n, start_dt, end_dt, staff_id)
+
+    return summary_cache.get_or_compute(
+        ('top', by, metric, n, start_dt, end_dt, staff_id), compute
+    )
+
+
+def top_sellers_from_rollup(by, metric, n, start_dt=None, end_dt=None, staff_id=None):
+    """top_sellers, ranked by the database with GROUP BY ... ORDER BY ... LIMIT
+    over the sales_daily rollup
+    """
+    rollup = SalesDaily.__table__
+    product = Product.__table__
+    source = rollup.join(product, rollup.c.product_id == product.c.id)
+    if by == 'product':
+        key = product.c.id
+        name = product.c.name
+    elif by == 'supplier':
+        supplier = Supplier.__table__
+        source = source.join(supplier, product.c.supplier_id == supplier.c.id)
+        key = supplier.c.id
+        name = supplier.c.name
+    elif by == 'tag':
+        tag = Tag.__table__
+        source = source\
+            .join(product_tags_table, product_tags_table.c.product_id == product.c.id)\
+            .join(tag, product_tags_table.c.tag_id == tag.c.id)
+        key = tag.c.id
+        name = tag.c.name
+    else:
+        raise ValueError("by must be one of {0}".format(', '.join(RANKINGS)))
+
+    totals = {
+        'units': func.sum(rollup.c.quantity).label('units'),
+        'gross': func.sum(rollup.c.gross).label('gross'),
+        'profit': func.sum(rollup.c.profit).label('profit')
     }
+    query = select([key.label('id'), name.label('name')] + [totals[m] for m in METRICS])\
+        .select_from(source)\
+        .group_by(key)\
+        .order_by(totals[metric].desc(), key)\
+        .limit(n)
+    query = filter_rollup(query, start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+
+    with timings.span('top.rank'):
+        return [dict(row) for row in db.engine.execute(query)]
+
+
+def top_sellers_from_sales(by, metric, n, start_dt=None, end_dt=None, staff_id=None):
+    """top_sellers, for databases without the rollup: streams the joined sales
+    once, keeping running totals per product/supplier/tag, and picks the top
+    n with a heap rather than sorting everything.
+    """
+    if by == 'product':
+        names = dict(db.session.query(Product.id, Product.name))
+        keys = lambda rec: [rec['product_id']]
+    elif by == 'supplier':
+        names = dict(db.session.query(Supplier.id, Supplier.name))
+        keys = lambda rec: [rec['supplier_id']] if rec['supplier_id'] in names else []
+    elif by == 'tag':
+        names = dict(db.session.query(Tag.id, Tag.name))
+        product_tags = {}
+        for (product_id, tag_id) in db.engine.execute(
+            select([product_tags_table.c.product_id, product_tags_table.c.tag_id])
+        ):
+            product_tags.setdefault(product_id, []).append(tag_id)
+        keys = lambda rec: product_tags.get(rec['product_id'], [])
+    else:
+        raise ValueError("by must be one of {0}".format(', '.join(RANKINGS)))
+
+    totals = {}
+    query = sales_query(start_dt=start_dt, end_dt=end_dt, staff_id=staff_id)
+    for row in db.engine.execute(query):
+        rec = dict(row)
+        units = handle_none(rec['quantity'], replace_with=1)
+        gross = rec['gross_sales']
+        profit = rec['profit']
+        for k in keys(rec):
+            t = totals.setdefault(
+                k, {'id': k, 'name': names.get(k), 'units': 0, 'gross': 0, 'profit': 0}
+            )
+            t['units'] += units
+            t['gross'] += gross
+            t['profit'] += profit
+
+    return heapq.nlargest(n, totals.values(), key=lambda t: (t[metric], -t['id']))
+
+
+def optional(v, coerce):
+    """None for a missing or blank value, otherwise coerce(v)"""
+    if v is None or (isinstance(v, str) and not v.strip()):
+        return None
+    return coerce(v)
+
+
+def to_flag(v):
+    return v in (True, 1, '1', 'true', 'on', 'y', 'yes')
+
+
+def to_number(v):
+    """a finite number, from a number or a numeric string. Booleans (which
+    Python would take for 0 and 1), NaN and infinity are refused.
+    """
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError("expected a number, got {0!r}".format(v))
+    if isinstance(v, int):
+        return v
+    try:
+        number = float(v)
+    except ValueError:
+        raise ValueError("expected a number, got {0!r}".format(v))
+    if not math.isfinite(number):
+        raise ValueError("expected a finite number, got {0!r}".format(v))
+    return number
+
+
+def to_whole_number(v, minimum=1):
+    """a whole number of at least `minimum`, e.g. a quantity or an id. Values
+    with a fractional part are refused rather than rounded.
+    """
+    number = to_number(v)
+    if number != int(number):
+        raise ValueError("expected a whole number, got {0!r}".format(v))
+    if number < minimum:
+        raise ValueError("must be at least {0}".format(minimum))
+    return int(number)
+
+
+def to_price(v):
+    """a finite price of at least 0"""
+    price = float(to_number(v))
+    if price < 0:
+        raise ValueError("can't be negative")
+    return price
+
+
+def parse_receipt_date(v):
+    """a receipt's date, from YYYY-MM-DD or YYYY-MM-DD HH:MM[:SS]"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(v, fmt)
+        except ValueError:
+            pass
+    raise ValueError("could not read date {0!r}".format(v))
+
+
+def receipt_rows(lines, errors):
+    """check a basket's line items and convert them to sale rows. Each line
+    names its product by `product_id` or `code`, and may give `quantity`,
+    `special_price`, `use_list_price` and `notes`. Products are looked up
+    with a single query. Lines that can't be used are recorded in `errors`.
+
+    Arguments:
+        lines {list} -- line items, as dicts
+        errors {list} -- messages are appended to this
+
+    Returns:
+        [list] -- a sale row (dict) per line, all with the same keys
+    """
+    if not lines:
+        errors.append("a receipt needs at least one line")
+        return []
+    if len(lines) > MAX_RECEIPT_LINES:
+        errors.append("a receipt can have at most {0} lines".format(MAX_RECEIPT_LINES))
+        return []
+
+    checked = []
+    line_errors = []
+    for n, line in enumerate(lines, start=1):
+        try:
+            if not isinstance(line, dict):
+                raise ValueError("expected an object")
+            row = {
+                'use_list_price': to_flag(line.get('use_list_price')),
+                'notes': optional(line.get('notes'), str)
+            }
+            for (name, coerce) in [
+                ('product_id', to_whole_number),
+                ('quantity', to_whole_number),
+                ('special_price', to_price)
+            ]:
+                try:
+                    row[name] = optional(line.get(name), coerce)
+                except ValueError as e:
+                    raise ValueError("{0}: {1}".format(name, e))
+            code = optional(line.get('code'), lambda v: str(v).strip())
+            if row['product_id'] is None and code is None:
+                raise ValueError("no product_id or code")
+        except (ValueError, TypeError) as e:
+            line_errors.append((n, str(e)))
+            continue
+        checked.append((n, row, code))
+
+    product = Product.__table__
+    ids = set(row['product_id'] for (_, row, _) in checked if row['product_id'] is not None)
+    codes = set(code for (_, row, code) in checked if row['product_id'] is None)
+    conditions = []
+    if ids:
+        conditions.append(product.c.id.in_(ids))
+    if codes:
+        conditions.append(product.c.code.in_(codes))
+    found_ids = set()
+    id_by_code = {}
+    if conditions:
+        for (product_id, code) in db.session.execute(
+            select([product.c.id, product.c.code]).where(or_(*conditions))
+        ):
+            found_ids.add(product_id)
+            id_by_code[code] = product_id
+
+    rows = []
+    for (n, row, code) in checked:
+        if row['product_id'] is None:
+            row['product_id'] = id_by_code.get(code)
+            if row['product_id'] is None:
+                line_errors.append((n, "no product with code {0!r}".format(code)))
+                continue
+        elif row['product_id'] not in found_ids:
+            line_errors.append((n, "no product with id {0}".format(row['product_id'])))
+            continue
+        if row['quantity'] is None:
+            row['quantity'] = 1
+        rows.append(row)
+    errors.extend("line {0}: {1}".format(n, e) for (n, e) in sorted(line_errors))
+    return rows
+
+
+def record_receipt(lines, staff_id=None, date=None, notes=None):
+    """record a basket as a receipt and one sale per line item. The sales
+    are inserted with a single executemany, and everything is committed in
+    one transaction: either the whole basket is recorded or (if any line is
+    invalid) none of it is. Selling prices, amounts, the rollup and
+    inventory are filled in by the usual triggers.
+
+    Arguments:
+        lines {list} -- line items, as dicts (see receipt_rows)
+
+    Keyword Arguments:
+        staff_id {int} -- id of the staff member who made the sale (default: {None})
+        date {datetime} -- when the sale was made; now if None (default: {None})
+        notes {str} -- notes about the receipt (default: {None})
+
+    Returns:
+        [tuple] -- (id of the new receipt or None, list of error messages)
+    """
+    errors = []
+    rows = receipt_rows(lines, errors)
+    staff = Staff.__table__
+    if staff_id is not None and db.session.execute(
+        select([staff.c.id]).where(staff.c.id == staff_id)
+    ).first() is None:
+        errors.append("no staff member with id {0}".format(staff_id))
+    if errors:
+        return None, errors
+
+    date = date or datetime.datetime.now()
+    try:
+        with timings.span('receipt.insert'):
+            receipt_id = db.session.execute(
+                Receipt.__table__.insert().values(date=date, staff_id=staff_id, notes=notes)
+            ).inserted_primary_key[0]
+            for row in rows:
+                row.update(receipt_id=receipt_id, date=date, staff_id=staff_id)
+            db.session.execute(Sale.__table__.insert(), rows)
+            # core inserts don't fire the mapper events that mark analytics
+            # as stale
+            db.session.info['analytics_stale'] = True
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return receipt_id, []
+
+
+def receipt_totals(receipt_id):
+    """a receipt with its number of lines, units, gross and profit
+
+    Returns:
+        [dict] -- or None if there's no such receipt
+    """
+    receipt = Receipt.__table__
+    sale = Sale.__table__
+    row = db.session.execute(
+        select([
+            receipt.c.id,
+            receipt.c.date,
+            receipt.c.staff_id,
+            receipt.c.notes,
+            func.count(sale.c.id).label('lines'),
+            func.ifnull(func.sum(func.ifnull(sale.c.quantity, 1)), 0).label('units'),
+            func.round(func.ifnull(func.sum(sale.c.gross), 0), 2).label('gross'),
+            func.round(func.ifnull(func.sum(sale.c.profit), 0), 2).label('profit')
+        ])
+        .select_from(receipt.outerjoin(sale, sale.c.receipt_id == receipt.c.id))
+        .where(receipt.c.id == receipt_id)
+        .group_by(receipt.c.id)
+    ).first()
+    if row is None:
+        return None
+    totals = dict(row)
+    totals['date'] = str(totals['date'])
+    return totals
+
+
+# full-text index of products, kept up to date by triggers (see
+# set_product_search in db_setup.py). It's an SQLite FTS5 virtual table, so it
+# isn't one of the models.
+product_search_table = table(
+    'product_search',
+    column('rowid'),
+    column('rank'),
+    column('product_search')
+)
+
+# search words that are (the start of) a YYYY-MM-DD date
+DATE_TERM = re.compile(r'^\d{4}(-\d{2}){0,2}$')
+
+
+def has_product_search():
+    return db.engine.has_table(product_search_table.name)
+
+
+def product_search_match(terms):
+    """condition matching the products in product_search that have every
+    search term as the start of a word
+    """
+    query = ' '.join('"{0}"*'.format(t.replace('"', '""')) for t in terms)
+    return product_search_table.c.product_search.op('MATCH')(query)
+
+
+def no_index(column):
+    """`+column`: the same value, but SQLite won't look it up in an index
+    """
+    return UnaryExpression(column, operator=operators.custom_op('+'))
+
+
+def product_search_ids(terms):
+    """select of the ids of the products matching every search term
+    """
+    return select([product_search_table.c.rowid]).where(product_search_match(terms))
 
 
 # ----------------------------------------------------------------------------
 # Models and corresponding custom Flask-Admin view classes
 # ----------------------------------------------------------------------------
 
+class KeysetModelView(ModelView):
+    """ModelView that pages with keyset ("seek") pagination: instead of
+    OFFSET-ing through every earlier row, each page starts with a WHERE on the
+    key of the last row of the page before, which SQLite answers from the
+    index. Those boundary keys, and the row count shown by the pager, are kept
+    in page_cache, so neither is worked out again until the data changes.
+
+    `keyset` names columns that are indexed and unique together, sort column
+    first; only the sort column may be NULL. Lists sorted by any other column
+    fall back to OFFSET (but still use the cached count).
+
+    A page is read with a fixed number of queries, whatever its size: only
+    the columns shown (or exported) are loaded, related rows shown in the
+    list come in the same query (loading just `list_related_columns` of
+    them, if given) and the `list_collections` of every row on the page in
+    one more query each.
+    """
+    keyset = ('id',)
+    # relationship: columns of the related rows that the list shows (i.e.
+    # that their __str__ uses)
+    list_related_columns = {}
+    # many-to-many relationships the list uses, e.g. for editable columns
+    list_collections = ()
+
+    def _list_options(self):
+        """loader options for the rows of a page
+        """
+        shown = self._list_columns
+        if has_request_context() and request.endpoint == self.endpoint + '.export':
+            shown = self._export_columns
+        names = set(name for (name, _) in shown) | set(self.keyset)
+        load = [
+            prop.key for prop in self.model.__mapper__.column_attrs
+            if prop.key in names or any(c.primary_key or c.foreign_keys for c in prop.columns)
+        ]
+        options = [load_only(*load)]
+        for attr in self._auto_joins:
+            loader = joinedload(attr)
+            if attr.key in self.list_related_columns:
+                loader = loader.load_only(*self.list_related_columns[attr.key])
+            options.append(loader)
+        for name in self.list_collections:
+            options.append(subqueryload(getattr(self.model, name)))
+        return options
+
+    def _keyset_descending(self, sort_column, sort_desc):
+        """True/False if the list is in descending/ascending keyset order,
+        or None if it's sorted by something else
+        """
+        if sort_column is None:
+            order = self._get_default_order()
+            if order is None:
+                return False
+            sort_column, sort_desc = order[0].key, order[2]
+        if sort_column != self.keyset[0]:
+            return None
+        return bool(sort_desc)
+
+    def _search_order(self, search):
+        """how to order search results when no sort column is chosen, or None
+        to list them in keyset order
+        """
+        return None
+
+    def _segments(self, columns, boundary, descending):
+        """conditions for the rows that come after `boundary` in keyset order,
+        as a list of ranges to be read one after the other (None means every
+        row). SQLite sorts NULLs first, so rows with no value in the sort
+        column are a range of their own; one condition covering both couldn't
+        be answered from the index.
+        """
+        if boundary is None:
+            return [None]
+        compare = operator.lt if descending else operator.gt
+
+        def after(cols, values):
+            values = [literal(v, NullType()) for v in values]
+            if len(cols) == 1:
+                return compare(cols[0], values[0])
+            return compare(tuple_(*cols), tuple_(*values))
+
+        if len(columns) == 1:
+            return [after(columns, boundary)]
+        if boundary[0] is None:
+            segments = [and_(columns[0].is_(None), after(columns[1:], boundary[1:]))]
+            return segments if descending else segments + [columns[0].isnot(None)]
+        segments = [after(columns, boundary)]
+        return segments + [columns[0].is_(None)] if descending else segments
+
+    def _boundary(self, query, columns, descending, state, page, page_size):
+        """key of the last row before `page`, found by reading only the
+        (indexed) key columns. Starts from the boundary of the page before
+        if it's cached, so paging forwards only reads one page of keys.
+        """
+        def compute():
+            keys = query.with_entities(*[type_coerce(c, NullType()) for c in columns])
+            previous = page_cache.get(state + (page - 1,)) if page > 1 else None
+            skip = page_size - 1 if previous is not None else page * page_size - 1
+            segments = self._segments(columns, previous, descending)
+            for i, segment in enumerate(segments):
+                rows = keys if segment is None else keys.filter(segment)
+                row = rows.offset(skip).limit(1).first()
+                if row is not None:
+                    return tuple(row)
+                if i < len(segments) - 1:
+                    skip -= rows.count()
+            return None
+
+        return page_cache.get_or_compute(state + (page,), compute)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        """same as ModelView.get_list, with keyset pagination and a cached
+        count
+        """
+        joins = {}
+        count_joins = {}
+        query = self.get_query()
+        count_query = self.get_count_query()
+
+        if self._search_supported and search:
+            query, count_query, joins, count_joins = self._apply_search(
+                query, count_query, joins, count_joins, search
+            )
+        if filters and self._filters:
+            query, count_query, joins, count_joins = self._apply_filters(
+                query, count_query, joins, count_joins, filters
+            )
+
+        state = (self.model.__tablename__, search or None, tuple(filters or ()))
+        count = page_cache.get_or_compute(('count',) + state, count_query.scalar)
+
+        if page_size is None:
+            page_size = self.page_size
+        columns = [getattr(self.model, name) for name in self.keyset]
+        search_order = self._search_order(search) if search and sort_column is None else None
+        if search_order is not None:
+            descending = None
+        else:
+            descending = self._keyset_descending(sort_column, sort_desc)
+
+        if descending is None:
+            query = query.options(*self._list_options())
+            if search_order is not None:
+                query = query.order_by(search_order, *columns)
+            else:
+                query, joins = self._apply_sorting(query, joins, sort_column, sort_desc)
+            query = self._apply_pagination(query, page, page_size)
+            return count, query.all() if execute else query
+
+        query = query.order_by(*[c.desc() if descending else c for c in columns])
+        boundary = None
+        if page and page_size:
+            boundary = self._boundary(
+                query, columns, descending,
+                ('keyset', page_size, descending) + state, page, page_size
+            )
+            if boundary is None:
+                # past the last page
+                return count, [] if execute else query.filter(false())
+        segments = self._segments(columns, boundary, descending)
+
+        query = query.options(*self._list_options())
+
+        if not execute:
+            # a single query, even if it can't all be read from the index
+            if segments != [None]:
+                query = query.filter(or_(*segments))
+            return count, query.limit(page_size) if page_size else query
+
+        rows = []
+        for segment in segments:
+            part = query if segment is None else query.filter(segment)
+            if page_size:
+                part = part.limit(page_size - len(rows))
+            rows += part.all()
+            if page_size and len(rows) >= page_size:
+                break
+        return count, rows
+
+
+class ProductSearchMixin(object):
+    """searches a ModelView with the product_search full-text index (see
+    db_setup.py) rather than with LIKE '%term%' on every searchable column.
+    Each word of the search matches the start of a word in a product's name,
+    code, fullname, supplier or tags, and every word has to match. Databases
+    without the index yet (see `db_setup.py upgrade`) get Flask-Admin's own
+    search.
+    """
+    # name of the model's column holding a product id
+    search_product_column = 'id'
+    # also match words that look like a date (2018, 2018-03, 2018-03-14)
+    # against the start of this column
+    search_date_column = None
+    # list the best matches first, unless sorted by a column
+    search_ranked = False
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        if not has_product_search():
+            return super(ProductSearchMixin, self)._apply_search(
+                query, count_query, joins, count_joins, search
+            )
+        terms = search.split()
+        product_id = getattr(self.model, self.search_product_column)
+        dates = []
+        if self.search_date_column is not None:
+            # only the first few: each one doubles the number of ways to match
+            dates = [t for t in terms if DATE_TERM.match(t)][:3]
+
+        # words that look like a date can match either the date or a product;
+        # all the others are matched against products in one go
+        branches = []
+        for as_date in itertools.product((False, True), repeat=len(dates)):
+            date_terms = [t for (t, d) in zip(dates, as_date) if d]
+            words = [t for t in terms if t not in date_terms]
+            branch = [self._date_starts_with(t) for t in date_terms]
+            if words:
+                # if there's a date, that's the index to use
+                column = no_index(product_id) if date_terms else product_id
+                branch.append(column.in_(product_search_ids(words)))
+            branches.append(and_(*branch))
+        condition = or_(*branches)
+
+        if self.search_ranked:
+            # the join filters and provides the rank (see _search_order)
+            matches = select([
+                product_search_table.c.rowid, product_search_table.c.rank
+            ]).where(product_search_match(terms)).alias('product_search_match')
+            query = query.join(matches, matches.c.rowid == product_id)
+        else:
+            query = query.filter(condition)
+        count_query = count_query.filter(condition)
+        return query, count_query, joins, count_joins
+
+    def _date_starts_with(self, term):
+        date = type_coerce(getattr(self.model, self.search_date_column), db.String)
+        # SQLite would compare a bare year with the dates as a number
+        start = term if '-' in term else term + '-'
+        return and_(date >= start, date < start + '~')
+
+    def _search_order(self, search):
+        if self.search_ranked and has_product_search():
+            # bm25 of the product_search_match join in _apply_search;
+            # lower is better
+            return literal_column('product_search_match.rank')
+        return None
+
+
 class Supplier(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), unique=True)
@@ -292,7 +1298,8 @@ product_tags_table = db.Table(
     'product_tags',
     db.Model.metadata,
     db.Column('product_id', db.Integer, db.ForeignKey('product.id')),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'))
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id')),
+    db.Index('ix_product_tags_product_id_tag_id', 'product_id', 'tag_id')
 )
 
 
@@ -309,7 +1316,7 @@ class Product(db.Model):
     discontinued = db.Column(db.Boolean())
 
     # REF: Supplier (brand) table
-    supplier_id = db.Column(db.Integer(), db.ForeignKey(Supplier.id))
+    supplier_id = db.Column(db.Integer(), db.ForeignKey(Supplier.id), index=True)
     supplier = db.relationship(Supplier, backref='suppliers')
 
     # auto-completed from database trigger (concatentates several fields)
@@ -329,7 +1336,11 @@ class Product(db.Model):
         return self.fullname
 
 
-class ProductView(ModelView):
+class ProductView(ProductSearchMixin, KeysetModelView):
+    keyset = ('id',)
+    search_ranked = True
+    list_related_columns = {'supplier': ('id', 'name')}
+    list_collections = ('tags',)
     column_formatters = {
         'list_price': format_currency,
         'selling_price': format_currency
@@ -340,15 +1351,18 @@ class ProductView(ModelView):
     column_editable_list = ['tags']
     action_disallowed_list = ['delete']
     page_size = 100
-    form_excluded_columns = ['products', 'fullname']
+    form_excluded_columns = ['products', 'fullname', 'stock']
     can_export = True
     can_delete = False
 
 
-'''
 class Stock(db.Model):
+    """a receipt of purchased stock. Adding, changing or removing one of these
+    updates the Inventory table (via triggers, see db_setup.py).
+    """
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id))
+    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id), index=True)
+    product = db.relationship(Product, backref='stock')
     units_purchased = db.Column(db.Integer, default=1)
     use_list_price = db.Column(db.Boolean(), default=False)
     special_price = db.Column(db.Float)
@@ -356,29 +1370,39 @@ class Stock(db.Model):
     notes = db.Column(db.Text)
 
     def __str__(self):
-        return self.units_purchased
+        return str(self.units_purchased)
+
+
+class StockView(ModelView):
+    column_formatters = {
+        'special_price': format_currency
+    }
+    column_searchable_list = (Product.fullname, Product.code, 'date')
+    column_exclude_list = ['notes', 'use_list_price']
+    column_default_sort = ('date', True)
+    can_export = True
 
 
 class Inventory(db.Model):
-    """Inventory is a table populated by triggers fired in the Order and Sales tables.
+    """Inventory is a table populated by triggers fired in the Stock and Sales tables.
     While directly editable, it should only need to be set-up once--for the initial
     inventory--and the triggers will handle the rest. Its primary purpose is to show
     how many items are left in stock
     """
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id))
+    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id), unique=True)
     notes = db.Column(db.Text)
 
     # in stock = initial volume - volume sold + volume replaced
-    # in_stock is used to set an initial volume during table setup
     in_stock = db.Column(
         db.Integer,
         default=0,
+        index=True,
         server_default=FetchedValue(),
         server_onupdate=FetchedValue()
     )
 
-    # total replaced = *deincremented* from Order table entries
+    # total replaced = *incremented* from Stock table entries
     volume_replaced = db.Column(
         db.Integer,
         default=0,
@@ -395,8 +1419,7 @@ class Inventory(db.Model):
     )
 
     def __str__(self):
-        return self.in_stock
-'''
+        return str(self.in_stock)
 
 
 class Tag(db.Model):
@@ -422,35 +1445,125 @@ class StaffView(ModelView):
 '''
 
 
+class Receipt(db.Model):
+    """a basket of sales rung up together at checkout. Its sales (one per
+    line item) are recorded in a single transaction by record_receipt.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.DateTime, default=datetime.datetime.now, index=True)
+    staff_id = db.Column(db.Integer(), db.ForeignKey(Staff.id), index=True)
+    staff = db.relationship(Staff)
+    notes = db.Column(db.Text)
+
+    def __str__(self):
+        return "#{0}".format(self.id)
+
+
+class ReceiptView(ModelView):
+    # receipts are recorded at /admin/checkout/, along with their sales
+    column_default_sort = ('date', True)
+    column_list = ('id', 'date', 'staff', 'notes')
+    column_searchable_list = ('notes',)
+    can_create = False
+    can_edit = False
+    can_delete = False
+    can_export = True
+
+
 class Sale(db.Model):
+    __table_args__ = (
+        # covers sale_amounts_query, so analytics read only the index
+        db.Index('ix_sale_amounts', 'date', 'staff_id', 'product_id', 'quantity', 'gross', 'profit'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, default=1)
-    date = db.Column(db.DateTime, default=datetime.datetime.now)
+    date = db.Column(db.DateTime, default=datetime.datetime.now, index=True)
     special_price = db.Column(db.Float)
     use_list_price = db.Column(db.Boolean(), default=False)
     notes = db.Column(db.Text)
-    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id))
+    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id), index=True)
     product = db.relationship(Product, backref='products')
-    staff_id = db.Column(db.Integer(), db.ForeignKey(Staff.id))
+    staff_id = db.Column(db.Integer(), db.ForeignKey(Staff.id), index=True)
     staff = db.relationship(Staff, backref='staff')
     sold_price = db.Column(db.Float)
+    receipt_id = db.Column(db.Integer(), db.ForeignKey(Receipt.id), index=True)
+    receipt = db.relationship(Receipt, backref='sales')
+
+    # auto-completed from database triggers: the product's list price when
+    # the sale was recorded, and the sale's gross and profit from it (see
+    # set_trigger_sale_amounts in db_setup.py)
+    unit_cost = db.Column(db.Float, server_default=FetchedValue(), server_onupdate=FetchedValue())
+    gross = db.Column(db.Float, server_default=FetchedValue(), server_onupdate=FetchedValue())
+    profit = db.Column(db.Float, server_default=FetchedValue(), server_onupdate=FetchedValue())
 
     def __str__(self):
         return self.product
 
 
-class SaleView(ModelView):
+class SalesDaily(db.Model):
+    """quantity, gross and profit per day, product and staff member. This is
+    maintained by triggers on the Sale table (see db_setup.py), so it should
+    never need to be edited directly.
+    """
+    __tablename__ = 'sales_daily'
+    __table_args__ = (
+        db.Index('ix_sales_daily_day_product_staff', 'day', 'product_id', 'staff_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.String(10))
+    product_id = db.Column(db.Integer(), db.ForeignKey(Product.id))
+    staff_id = db.Column(db.Integer(), db.ForeignKey(Staff.id))
+    quantity = db.Column(db.Integer, default=0)
+    gross = db.Column(db.Float, default=0)
+    profit = db.Column(db.Float, default=0)
+
+
+class SaleView(ProductSearchMixin, KeysetModelView):
+    keyset = ('date', 'id')
+    search_product_column = 'product_id'
+    search_date_column = 'date'
+    list_related_columns = {'product': ('id', 'fullname'), 'staff': ('id', 'name')}
+    column_default_sort = ('date', True)
     column_formatters = {
         'special_price': format_currency,
         'sold_price': format_currency
     }
     column_searchable_list = (Product.fullname, Product.code, 'date')
     column_exclude_list = ['notes', 'special_price',
-                           'fullname', 'use_list_price']
-    form_excluded_columns = ['sold_price']
+                           'fullname', 'use_list_price',
+                           'unit_cost', 'gross', 'profit', 'receipt']
+    form_excluded_columns = ['sold_price', 'unit_cost', 'gross', 'profit', 'receipt']
     can_export = True
 
 
+# ----------------------------------------------------------------------------
+# Analytics cache invalidation
+# ----------------------------------------------------------------------------
+
+def mark_analytics_stale(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['analytics_stale'] = True
+
+
+def clear_analytics_cache(session):
+    if session.info.pop('analytics_stale', False):
+        summary_cache.clear()
+        page_cache.clear()
+
+
+def forget_analytics_stale(session, previous_transaction=None):
+    session.info.pop('analytics_stale', None)
+
+
+# supplier and tag names are shown in (and searched from) the product list
+for model in (Sale, Product, Staff, Supplier, Tag):
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, mark_analytics_stale)
+event.listen(db.session, 'after_commit', clear_analytics_cache)
+event.listen(db.session, 'after_soft_rollback', forget_analytics_stale)
+
+
 # ----------------------------------------------------------------------------
 # Custom view classes (uses Flask-Admin template but not derived from table)
 # ----------------------------------------------------------------------------
@@ -458,24 +1571,239 @@ class SaleView(ModelView):
 class InventoryView(BaseView):
     @expose('/')
     def index(self):
-        return self.render('pages/inventory.html')
+        low_stock = app.config.get('INVENTORY_LOW_STOCK', 10)
+        reorder_level = app.config.get('INVENTORY_REORDER_LEVEL', 5)
+        inventory = Inventory.__table__
+        product = Product.__table__
+
+        # uses the index on in_stock, so only low items are read
+        items = db.engine.execute(
+            select([
+                product.c.fullname,
+                product.c.code,
+                inventory.c.in_stock,
+                inventory.c.volume_sold,
+                inventory.c.volume_replaced
+            ])
+            .select_from(inventory.join(product, inventory.c.product_id == product.c.id))
+            .where(inventory.c.in_stock <= low_stock)
+            .order_by(inventory.c.in_stock)
+        ).fetchall()
+        totals = db.engine.execute(
+            select([
+                func.count(inventory.c.id),
+                func.sum(inventory.c.in_stock)
+            ]).where(inventory.c.in_stock > 0)
+        ).first()
+
+        return self.render(
+            'pages/inventory.html',
+            items=items,
+            products_in_stock=totals[0],
+            units_in_stock=totals[1] or 0,
+            low_stock=low_stock,
+            reorder_level=reorder_level
+        )
 
 
 class AnalyticsView(BaseView):
     @expose('/')
     def index(self):
-        summary = sales_summary()
-        print(summary['chart_gross_missing_date'])
+        # the figures themselves are fetched from summary_api by summaryChart.js
+        staff = db.session.query(Staff.id, Staff.name).order_by(Staff.name).all()
+        with timings.span('render'):
+            return self.render(
+                'pages/analytics.html',
+                staff=staff,
+                granularities=GRANULARITIES,
+                rankings=RANKINGS,
+                metrics=METRICS
+            )
+
+    @expose('/api/summary')
+    @conditional
+    def summary_api(self):
+        """the sales summary as JSON. Accepts optional `start` and `end`
+        (YYYY-MM-DD), `granularity` (day, week, month or year) and `staff_id`
+        query string parameters.
+        """
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            abort(400)
+        summary = analytics_summary(
+            start_dt=parse_date_arg('start'),
+            end_dt=parse_date_arg('end', end_of_day=True),
+            staff_id=request.args.get('staff_id', type=int),
+            granularity=granularity
+        )
+        with timings.span('json'):
+            return jsonify(summary)
+
+    @expose('/api/top')
+    @conditional
+    def top_api(self):
+        """the top sellers as JSON. Accepts optional `by` (product, supplier or
+        tag), `metric` (units, gross or profit), `n`, `start` and `end`
+        (YYYY-MM-DD) and `staff_id` query string parameters.
+        """
+        by = request.args.get('by', 'product')
+        metric = request.args.get('metric', 'gross')
+        n = request.args.get('n', 10, type=int)
+        if by not in RANKINGS or metric not in METRICS or not 0 < n <= 1000:
+            abort(400)
+        return jsonify(top_sellers(
+            by=by,
+            metric=metric,
+            n=n,
+            start_dt=parse_date_arg('start'),
+            end_dt=parse_date_arg('end', end_of_day=True),
+            staff_id=request.args.get('staff_id', type=int)
+        ))
+
+    @expose('/cache')
+    def cache(self):
+        """hit/miss counters and size of the analytics cache, as JSON
+        """
+        return jsonify(summary_cache.stats())
+
+    @expose('/export/sales.csv')
+    @conditional
+    def export(self):
+        """streams the sales data as a CSV download. Accepts optional `start`
+        and `end` (YYYY-MM-DD) and `staff_id` query string parameters.
+        """
+        rows = export_data(
+            start_dt=parse_date_arg('start'),
+            end_dt=parse_date_arg('end', end_of_day=True),
+            staff_id=request.args.get('staff_id', type=int)
+        )
+        return Response(
+            stream_with_context(rows),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=sales.csv'}
+        )
+
+class CheckoutView(BaseView):
+    """rings up a whole basket at once, from a form (one row per line item)
+    or as JSON; see record_receipt
+    """
+
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        staff = db.session.query(Staff.id, Staff.name).order_by(Staff.name).all()
+        errors = []
+        lines = []
+        staff_id = request.form.get('staff_id', type=int)
+        notes = request.form.get('notes') or None
+        if request.method == 'POST':
+            # one value per form row; rows without a product code are blank
+            form = request.form
+            lines = [
+                {'code': code, 'quantity': quantity, 'special_price': special_price, 'use_list_price': use_list_price}
+                for (code, quantity, special_price, use_list_price) in zip(
+                    form.getlist('code'),
+                    form.getlist('quantity'),
+                    form.getlist('special_price'),
+                    form.getlist('use_list_price')
+                )
+                if code.strip()
+            ]
+            receipt_id, errors = record_receipt(lines, staff_id=staff_id, notes=notes)
+            if receipt_id is not None:
+                totals = receipt_totals(receipt_id)
+                flash("Receipt {0}: {1} line(s), {2} unit(s), ${3:,.2f}".format(
+                    receipt_id, totals['lines'], totals['units'], totals['gross']
+                ), 'success')
+                return redirect(url_for('.index', staff_id=staff_id))
         return self.render(
-            'pages/analytics.html',
-            summaryChartData=json.dumps(summary),
-            gross_sales="${:,.2f}".format(summary['gross_sales']),
-            profits="${:,.2f}".format(summary['profits']),
-            chart_gross_missing_date=summary['chart_gross_missing_date'][0]['y'],
-            chart_profit_missing_date=summary['chart_profit_missing_date'][0]['y'],
-            chart_count_missing_date=summary['chart_count_missing_date'][0]['y']
+            'pages/checkout.html',
+            staff=staff,
+            staff_id=staff_id or request.args.get('staff_id', type=int),
+            notes=notes,
+            lines=lines,
+            errors=errors,
+            blank_lines=max(CHECKOUT_FORM_LINES - len(lines), 1)
         )
 
+    @expose('/api/receipts', methods=('POST',))
+    def receipts_api(self):
+        """records a basket posted as JSON: `lines` (a list of line items,
+        each with `product_id` or `code`, and optionally `quantity`,
+        `special_price`, `use_list_price` and `notes`), and optional
+        `staff_id`, `date` (YYYY-MM-DD[ HH:MM:SS]) and `notes`. Returns the
+        new receipt's totals, or a 400 with `errors` if anything in it is
+        invalid, in which case nothing is recorded.
+        """
+        basket = request.get_json(silent=True)
+        if not isinstance(basket, dict):
+            return jsonify(errors=["expected a JSON object"]), 400
+        try:
+            staff_id = optional(basket.get('staff_id'), to_whole_number)
+        except ValueError as e:
+            return jsonify(errors=["staff_id: {0}".format(e)]), 400
+        try:
+            date = optional(basket.get('date'), parse_receipt_date)
+        except (ValueError, TypeError) as e:
+            return jsonify(errors=[str(e)]), 400
+        lines = basket.get('lines')
+        if not isinstance(lines, list):
+            return jsonify(errors=["lines must be a list"]), 400
+        receipt_id, errors = record_receipt(
+            lines, staff_id=staff_id, date=date, notes=optional(basket.get('notes'), str)
+        )
+        if errors:
+            return jsonify(errors=errors), 400
+        with timings.span('json'):
+            return jsonify(receipt_totals(receipt_id)), 201
+
+
+class ProfilerView(BaseView):
+    @expose('/')
+    def index(self):
+        order_by = request.args.get('order_by', 'total_ms')
+        if order_by not in ('total_ms', 'max_ms', 'mean_ms', 'count'):
+            abort(400)
+        return self.render(
+            'pages/profiler.html',
+            stats=query_profiler.stats(order_by=order_by),
+            order_by=order_by
+        )
+
+    @expose('/api')
+    def api(self):
+        """the profiler's totals as JSON. Accepts optional `order_by`
+        (total_ms, max_ms, mean_ms or count) and `limit` query string
+        parameters.
+        """
+        order_by = request.args.get('order_by', 'total_ms')
+        limit = request.args.get('limit', 50, type=int)
+        if order_by not in ('total_ms', 'max_ms', 'mean_ms', 'count'):
+            abort(400)
+        return jsonify(query_profiler.stats(order_by=order_by, limit=limit))
+
+    @expose('/reset', methods=('POST',))
+    def reset(self):
+        query_profiler.reset()
+        return redirect(url_for('.index'))
+
+
+class TimingView(BaseView):
+    @expose('/')
+    def index(self):
+        return self.render('pages/timings.html', stats=timings.stats())
+
+    @expose('/api')
+    def api(self):
+        """p50/p95/p99 request times per endpoint and span times per stage,
+        as JSON
+        """
+        return jsonify(timings.stats())
+
+    @expose('/reset', methods=('POST',))
+    def reset(self):
+        timings.reset()
+        return redirect(url_for('.index'))
+
 # ----------------------------------------------------------------------------
 # Flask Views
 # ----------------------------------------------------------------------------
@@ -499,10 +1827,17 @@ admin = admin.Admin(
 
 # Add model views
 admin.add_view(SaleView(Sale, db.session))
+admin.add_view(ReceiptView(Receipt, db.session))
 admin.add_view(SupplierView(Supplier, db.session))
 admin.add_view(ProductView(Product, db.session))
 admin.add_view(ModelView(Tag, db.session))
 admin.add_view(ModelView(Staff, db.session))
+admin.add_view(StockView(Stock, db.session))
 # add custom views
+admin.add_view(CheckoutView(name='Checkout', endpoint='checkout'))
 admin.add_view(InventoryView(name='Inventory', endpoint='inventory'))
 admin.add_view(AnalyticsView(name='Analytics', endpoint='analytics'))
+if query_profiler is not None:
+    admin.add_view(ProfilerView(name='Profiler', endpoint='profiler'))
+if timings.enabled:
+    admin.add_view(TimingView(name='Timings', endpoint='timings'))
@@ -15,6 +15,45 @@ FLASK_ADMIN_SWATCH = "readable"
 # database
 DATABASE_FILE = 'inventory_0.1.0.sqlite'
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DATABASE_FILE
-SQLALCHEMY_ECHO = True
-SQLALCHEMY_TRACK_MODIFICATIONS = True
-SQLALCHEMY_LOGGING = False
\ No newline at end of file
+SQLALCHEMY_ECHO = False
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_LOGGING = False
+
+# SQL profiler: times every statement, by query and by page (see
+# /admin/profiler/). Statements slower than SQL_PROFILER_SLOW_MS are logged.
+SQL_PROFILER = False
+SQL_PROFILER_SLOW_MS = 100
+SQL_PROFILER_MAX_STATEMENTS = 500
+
+# request and stage timings: rolling p50/p95/p99 per page and per stage of the
+# sales summaries (see /admin/timings/), plus a Server-Timing response header
+TIMING = False
+TIMING_WINDOW = 1000
+TIMING_HEADER = True
+
+# SQLite connection settings; see SQLITE_PRAGMAS in app.py for the defaults.
+# e.g. SQLITE_PRAGMAS = {'journal_mode': 'DELETE', 'mmap_size': None}
+SQLITE_PRAGMAS = {}
+# connections kept open for the server's threads (0 opens one per request)
+SQLITE_POOL_SIZE = 5
+SQLITE_MAX_OVERFLOW = 10
+
+# inventory: items at or below these levels are listed on the Inventory page
+INVENTORY_LOW_STOCK = 10
+INVENTORY_REORDER_LEVEL = 5
+
+# analytics: results are cached in memory, up to this many entries/bytes
+ANALYTICS_CACHE_ENTRIES = 32
+ANALYTICS_CACHE_BYTES = 16 * 1024 * 1024
+
+# list views: row counts and page positions are cached, up to this many entries/bytes
+PAGE_CACHE_ENTRIES = 1024
+PAGE_CACHE_BYTES = 1024 * 1024
+
+# HTTP: compress text responses (gzip, or brotli if the brotli package is
+# installed) of at least COMPRESS_MIN_SIZE bytes; static files get
+# fingerprinted URLs and are cached by the browser for STATIC_MAX_AGE seconds
+COMPRESS = True
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 500
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
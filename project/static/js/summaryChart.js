@@ -5,6 +5,16 @@ function dateify(rec) {
     };
 }
 
+function missingTotal(recs) {
+    return recs.reduce(function(total, rec) {
+        return total + rec.y;
+    }, 0);
+}
+
+function formatCurrency(v) {
+    return "$" + v.toFixed(2).replace(/\B(?=(\d{3})+(?!\d))/g, ",");
+}
+
 window.chartColors = {
     red: "rgb(255, 99, 132)",
     orange: "rgb(255, 159, 64)",
@@ -15,15 +25,6 @@ window.chartColors = {
     grey: "rgb(201, 203, 207)"
 };
 
-// var summaryChartDataCount = summaryChartData.chart_count.map(function(rec) {
-//     return dateify(rec);
-// });
-// console.log(summaryChartDataCount);
-// var summaryChartDataProfit = summaryChartData.chart_gross.map(function(rec) {
-//     return dateify(rec);
-// });
-// console.log(summaryChartDataProfit);
-
 var color = Chart.helpers.color;
 var timeFormat = "MM/DD/YYYY";
 var summaryCountChart = new Chart(
@@ -37,9 +38,7 @@ var summaryCountChart = new Chart(
                     .alpha(0.5)
                     .rgbString(),
                 borderColor: window.chartColors.green,
-                data: summaryChartData.chart_count.map(function(rec) {
-                    return dateify(rec);
-                })
+                data: []
             }]
         },
         options: {
@@ -75,9 +74,7 @@ var summarySalesChart = new Chart(
                         .alpha(0.5)
                         .rgbString(),
                     borderColor: window.chartColors.blue,
-                    data: summaryChartData.chart_gross.map(function(rec) {
-                        return dateify(rec);
-                    })
+                    data: []
                 },
                 {
                     label: "Profits ($)",
@@ -86,9 +83,7 @@ var summarySalesChart = new Chart(
                         .alpha(0.5)
                         .rgbString(),
                     borderColor: window.chartColors.red,
-                    data: summaryChartData.chart_profit.map(function(rec) {
-                        return dateify(rec);
-                    })
+                    data: []
                 }
             ]
         },
@@ -112,4 +107,86 @@ var summarySalesChart = new Chart(
             }
         }
     }
-);
\ No newline at end of file
+);
+
+// query string for the current filter selections
+function summaryQuery() {
+    var form = document.getElementById("summaryFilters");
+    var params = [];
+    for (var i = 0; i < form.elements.length; i++) {
+        var el = form.elements[i];
+        if (el.name && el.value) {
+            params.push(encodeURIComponent(el.name) + "=" + encodeURIComponent(el.value));
+        }
+    }
+    return params.join("&");
+}
+
+function renderSummary(summaryChartData, granularity) {
+    var period = granularity.charAt(0).toUpperCase() + granularity.slice(1);
+    var labels = document.getElementsByClassName("summaryPeriod");
+    for (var i = 0; i < labels.length; i++) {
+        labels[i].textContent = period;
+    }
+    document.getElementById("grossSales").textContent = formatCurrency(summaryChartData.gross_sales);
+    document.getElementById("profits").textContent = formatCurrency(summaryChartData.profits);
+    document.getElementById("grossMissingDate").textContent = missingTotal(summaryChartData.chart_gross_missing_date).toFixed(2);
+    document.getElementById("countMissingDate").textContent = missingTotal(summaryChartData.chart_count_missing_date);
+
+    summaryCountChart.data.datasets[0].data = summaryChartData.chart_count.map(dateify);
+    summaryCountChart.options.title.text = "Transactions Per " + period;
+    summaryCountChart.update();
+
+    summarySalesChart.data.datasets[0].data = summaryChartData.chart_gross.map(dateify);
+    summarySalesChart.data.datasets[1].data = summaryChartData.chart_profit.map(dateify);
+    summarySalesChart.options.title.text = "Gross Sales per " + period;
+    summarySalesChart.update();
+}
+
+function renderTop(by, rows) {
+    var body = document.getElementById("top-" + by);
+    body.innerHTML = "";
+    rows.forEach(function(row) {
+        var tr = document.createElement("tr");
+        [row.name, row.units, formatCurrency(row.gross), formatCurrency(row.profit)].forEach(function(v, i) {
+            var td = document.createElement("td");
+            td.textContent = v;
+            if (i > 0) {
+                td.className = "text-right";
+            }
+            tr.appendChild(td);
+        });
+        body.appendChild(tr);
+    });
+}
+
+function loadTop(by, query) {
+    var req = new XMLHttpRequest();
+    req.open("GET", topApiUrl + "?by=" + by + (query ? "&" + query : ""));
+    req.onload = function() {
+        if (req.status === 200) {
+            renderTop(by, JSON.parse(req.responseText));
+        }
+    };
+    req.send();
+}
+
+function loadSummary() {
+    var query = summaryQuery();
+    var granularity = document.getElementById("filterGranularity").value;
+    document.getElementById("exportLink").href = summaryExportUrl + (query ? "?" + query : "");
+    var req = new XMLHttpRequest();
+    req.open("GET", summaryApiUrl + (query ? "?" + query : ""));
+    req.onload = function() {
+        if (req.status === 200) {
+            renderSummary(JSON.parse(req.responseText), granularity);
+        }
+    };
+    req.send();
+    topRankings.forEach(function(by) {
+        loadTop(by, query);
+    });
+}
+
+document.getElementById("summaryFilters").addEventListener("change", loadSummary);
+loadSummary();
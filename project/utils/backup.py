@@ -1,6 +1,9 @@
 import os
+import io
+import re
+import csv
+import glob
 import sqlite3
-import petl as etl
 import click
 import zipfile
 import time
@@ -12,72 +15,283 @@ try:
 except:
 	compression = zipfile.ZIP_STORED
 
+# name of the SQL dump inside a backup archive
+DUMP_NAME = 'inventory.sql'
+
+# statements of an older SQL dump (made with Connection.iterdump) that build
+# the product_search full-text index (see set_product_search in db_setup.py).
+# iterdump creates the FTS5 table by writing to sqlite_master, which can't be
+# replayed, so once such a dump turns on writable_schema these are left out
+# when restoring it and the index is rebuilt afterwards.
+SEARCH_INDEX_STATEMENT = re.compile(
+    r'''\s*(PRAGMA writable_schema|INSERT INTO sqlite_master\b.*'product_search'|'''
+    r'''(CREATE TABLE|INSERT INTO|CREATE TRIGGER)\s+["']?product_search)''',
+    re.DOTALL
+)
+
+# tables a virtual table keeps its contents in (FTS5, FTS3/4 and R*Tree)
+SHADOW_SUFFIXES = (
+    '_config', '_content', '_data', '_docsize', '_idx',
+    '_segdir', '_segments', '_stat', '_node', '_parent', '_rowid'
+)
+
 def timestamp():
 	"""return current date/time as a string: "yyyymmddHHMMSS"
 	"""
 	return time.strftime("%Y%m%d_%H%M%S", time.localtime())
 
-@click.command()
+
+def quote_name(name):
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+def insert_statements(conn, table, virtual=False):
+    """an INSERT statement for each row of the table, built by SQLite with
+    quote() as Connection.iterdump does. Rows of a virtual table are inserted
+    with their rowid, through the table itself.
+    """
+    columns = [quote_name(r[1]) for r in conn.execute('PRAGMA table_info({0})'.format(quote_name(table)))]
+    if virtual:
+        columns.insert(0, 'rowid')
+        target = '{0}({1})'.format(quote_name(table), ','.join(columns))
+    else:
+        target = quote_name(table)
+    values = "||','||".join('quote({0})'.format(c) for c in columns)
+    q = "SELECT 'INSERT INTO {0} VALUES('||{1}||')' FROM {2}".format(
+        target.replace("'", "''"), values, quote_name(table)
+    )
+    for (statement,) in conn.execute(q):
+        yield '{0};'.format(statement)
+
+
+def dump(conn):
+    """the database as SQL statements, much like Connection.iterdump, except
+    that a virtual table (i.e. the product_search index) is created with its
+    own CREATE VIRTUAL TABLE statement and filled through itself, and its
+    shadow tables are left out, so the dump replays as it is. Statements are
+    generated a row at a time, so the database is never held in memory; the
+    caller should hold a read transaction so that they all come from the same
+    version of it.
+    """
+    yield 'BEGIN TRANSACTION;'
+    tables = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE sql NOT NULL AND type = 'table' ORDER BY name"
+    ).fetchall()
+    virtual = [name for (name, sql) in tables if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    for (name, sql) in tables:
+        if any(name == v + suffix for v in virtual for suffix in SHADOW_SUFFIXES):
+            continue
+        if name == 'sqlite_sequence':
+            yield 'DELETE FROM "sqlite_sequence";'
+        elif name == 'sqlite_stat1':
+            yield 'ANALYZE "sqlite_master";'
+        elif name.startswith('sqlite_'):
+            continue
+        else:
+            yield '{0};'.format(sql)
+        for statement in insert_statements(conn, name, virtual=name in virtual):
+            yield statement
+    # indexes, triggers and views go last, so that the rows above don't fire
+    # the triggers when they're replayed
+    for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE sql NOT NULL AND type IN ('index', 'trigger', 'view')"
+    ):
+        yield '{0};'.format(sql)
+    yield 'COMMIT;'
+
+
+def write_dump(conn, zf):
+    """stream an SQL dump of the database into the archive, from a single
+    read transaction. With the database in WAL mode (as the app sets it) the
+    app can keep writing meanwhile; otherwise its writes wait until the dump
+    is done.
+    """
+    conn.isolation_level = None
+    conn.execute('BEGIN')
+    try:
+        with zf.open(DUMP_NAME, mode='w', force_zip64=True) as f:
+            text = io.TextIOWrapper(f, encoding='utf-8')
+            for statement in dump(conn):
+                text.write(statement)
+                text.write('\n')
+            text.flush()
+            text.detach()
+    finally:
+        conn.execute('COMMIT')
+
+
+def dump_statements(lines):
+    """split the lines of an SQL dump into its statements"""
+    statement = ''
+    for line in lines:
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+
+def clear_schema(conn):
+    """drop every trigger, view and table, to restore over an existing
+    database. Virtual tables go first, taking their shadow tables with them.
+    """
+    def names(where):
+        return [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' AND " + where
+        ).fetchall()]
+    for name in names("type = 'trigger'"):
+        conn.execute('DROP TRIGGER {0}'.format(quote_name(name)))
+    for name in names("type = 'view'"):
+        conn.execute('DROP VIEW {0}'.format(quote_name(name)))
+    for name in names("type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"):
+        conn.execute('DROP TABLE {0}'.format(quote_name(name)))
+    for name in names("type = 'table'"):
+        conn.execute('DROP TABLE {0}'.format(quote_name(name)))
+
+
+def restore_dump(lines, conn):
+    """replay an SQL dump into the database, in the dump's own transaction,
+    after clearing out whatever is there, so that a failed restore leaves
+    the database as it was. The product_search index of an older dump is
+    left out.
+
+    Returns:
+        [bool] -- whether the search index was left out
+    """
+    conn.isolation_level = None
+    conn.execute('PRAGMA foreign_keys = OFF')
+    legacy = False
+    skipped = False
+    try:
+        for statement in dump_statements(lines):
+            if statement.lstrip().startswith('PRAGMA writable_schema'):
+                legacy = True
+            if legacy and SEARCH_INDEX_STATEMENT.match(statement):
+                skipped = True
+                continue
+            conn.execute(statement)
+            if statement.strip() == 'BEGIN TRANSACTION;':
+                clear_schema(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    return skipped
+
+
+def write_csvs(conn, zf):
+    """stream each table into the archive as a csv
+    """
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    for table in tables:
+        click.echo(table)
+        with zf.open('{0}.csv'.format(table), mode='w', force_zip64=True) as f:
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            cursor = conn.execute('SELECT * FROM "{0}"'.format(table))
+            writer.writerow([d[0] for d in cursor.description])
+            writer.writerows(cursor)
+            text.flush()
+            text.detach()
+
+
+def prune_backups(backup_path, keep):
+    """delete all but the newest `keep` inventory_backup_*.zip files. At
+    least one is always kept, so the backup just made is never deleted.
+
+    Returns:
+        [list] -- paths of the deleted archives
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    archives = sorted(glob.glob(os.path.join(backup_path, "inventory_backup_*.zip")))
+    old = archives[:-keep]
+    for each in old:
+        os.remove(each)
+    return old
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command('backup')
 @click.argument('sqlite_db')
 @click.argument('backup_path')
-def run_backup(sqlite_db, backup_path):
-    """backs-up each table in the inventory database to a csv,
-    zips them all up, and saves the zip with a timestamp-derived name.
+@click.option('--csv', 'as_csv', is_flag=True,
+              help='store each table as a csv instead of a restorable copy of the database')
+@click.option('--keep', type=click.IntRange(min=1), default=None,
+              help='after backing up, delete all but this many of the newest backups')
+def run_backup(sqlite_db, backup_path, as_csv, keep):
+    """backs-up the inventory database to a zip, saved with a timestamp-derived
+    name. The database is read in a single transaction and streamed straight
+    into the archive, so the app can stay open while this runs and nothing is
+    written anywhere else.
     """
     ts = timestamp()
-    
-    # SET UP THE FOLDERS -----------------------------------------------------
 
     #check for backup folder, make if it doesn't exist
     if not os.path.exists(backup_path):
         os.makedirs(backup_path)
-    
-    #make a folder for this backup
-    this_backup_path = os.path.join(backup_path, "backup_{0}".format(ts))
-    if not os.path.exists(this_backup_path):
-        os.makedirs(this_backup_path)
-    click.echo(this_backup_path)
-    
-    # GET THE DATA OUT -------------------------------------------------------
-    
-    # temporarily store extracted csv files. (use this to delete them later)
-    csvs = []
-    
-    # connect to the DB, get each table, save out as a csv.
-    conn = sqlite3.connect(sqlite_db)
-    for table in ['product','product_tags','sale','staff','supplier','tag']:
-        t = etl.fromdb(
-            lambda: conn.cursor(), """SELECT * FROM {0}""".format(table)
-        )
-        out_csv = os.path.join(this_backup_path,'{0}.csv'.format(table))
-        etl.tocsv(t, out_csv)
-        csvs.append(out_csv)
-    
-    
+
     # ZIP THE DATA UP --------------------------------------------------------
-        
+
     # make a zip file in the main backup location
     zipfile_directory = os.path.join(
         backup_path,
         "inventory_backup_{0}.zip".format(ts)
     )
-    # create a zip file object
-    zf = zipfile.ZipFile(zipfile_directory, mode="w")
-    
-    for each in csvs:
-        click.echo(each)
-        zf.write(
-            filename=each,
-            arcname=os.path.basename(each),
-            compress_type=compression
+    click.echo(zipfile_directory)
+    conn = sqlite3.connect(sqlite_db)
+    try:
+        with zipfile.ZipFile(zipfile_directory, mode="w", compression=compression) as zf:
+            if as_csv:
+                write_csvs(conn, zf)
+            else:
+                write_dump(conn, zf)
+    finally:
+        conn.close()
+
+    # REMOVE OLD BACKUPS -----------------------------------------------------
+
+    if keep is not None:
+        for each in prune_backups(backup_path, keep):
+            click.echo("removed {0}".format(each))
+
+
+@cli.command('restore')
+@click.argument('backup_zip')
+@click.argument('sqlite_db')
+@click.option('--force', is_flag=True, help='overwrite an existing database')
+def run_restore(backup_zip, sqlite_db, force):
+    """restores a backup made by the `backup` command (not --csv) into the
+    given database file, replacing everything in it. Backups made before the
+    product search index could be dumped are restored without it; run
+    `python db_setup.py upgrade` on the restored database to rebuild it.
+    """
+    if os.path.exists(sqlite_db) and not force:
+        raise click.ClickException(
+            "{0} already exists (use --force to overwrite it)".format(sqlite_db)
         )
-    zf.close()
-    
-    # REMOVE TEMP FILES -------------------------------------------------------
-    
-    for each in csvs:
-        os.remove(each)
-    os.rmdir(this_backup_path)
-    
+    with zipfile.ZipFile(backup_zip) as zf:
+        if DUMP_NAME not in zf.namelist():
+            raise click.ClickException(
+                "{0} has no {1}; csv backups can't be restored".format(backup_zip, DUMP_NAME)
+            )
+        dest = sqlite3.connect(sqlite_db)
+        try:
+            with zf.open(DUMP_NAME) as f:
+                skipped = restore_dump(io.TextIOWrapper(f, encoding='utf-8'), dest)
+        finally:
+            dest.close()
+    click.echo("restored {0} to {1}".format(backup_zip, sqlite_db))
+    if skipped:
+        click.echo("the product search index wasn't restored; rebuild it with `python db_setup.py upgrade`")
+
+
 if __name__ == '__main__':
-    run_backup()
\ No newline at end of file
+    cli()
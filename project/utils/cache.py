@@ -0,0 +1,82 @@
+"""A small, thread-safe, in-memory LRU cache for analytics results, bounded
+by both number of entries and (approximate) size.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+
+class SummaryCache(object):
+    """LRU cache of JSON-serializable results. Each entry's size is taken as
+    the length of its JSON encoding; least recently used entries are evicted
+    until the cache is within both `max_entries` and `max_bytes`.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """return the cached value for key, or default. Doesn't count towards
+        hits/misses.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            return default
+
+    def get_or_compute(self, key, compute):
+        """return the cached value for key, or call compute() and cache it
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            generation = self.invalidations
+
+        value = compute()
+        size = len(json.dumps(value, default=str))
+
+        with self._lock:
+            # don't keep a result computed from data that changed meanwhile,
+            # or one that would never fit
+            if generation != self.invalidations or size > self.max_bytes:
+                return value
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,245 @@
+"""HTTP-level caching and compression: ETags for responses built from the
+database, derived from SQLite's data_version so that unchanged data can be
+answered with a 304; gzip (or brotli, if the
+brotli package is installed) compression of text responses; and
+fingerprinted static file URLs that browsers can cache for good.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import request
+from flask.helpers import safe_join
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class DataVersion(object):
+    """a version number for the contents of an SQLite database, bumped
+    whenever anything (this app, db_setup.py, another process) commits to it.
+    It's read from PRAGMA data_version on a connection of its own that never
+    writes, which costs next to nothing, so it can be checked on every
+    request. `on_change` is called whenever a new version is seen.
+    """
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._path = None
+        self._conn = None
+        self._data_version = None
+        # versions restart from 0 with the process, so ETags from an
+        # earlier run never match
+        self._run = '{0:x}'.format(int(time.time() * 1000))
+        self.version = 0
+
+    def check(self, path):
+        """the current ETag for the database at path. There's no
+        Last-Modified to go with it: all that's known is when this process
+        noticed a change, not when it was made.
+
+        Returns:
+            [str] -- the ETag, or None if path isn't an SQLite file
+        """
+        if not path or path == ':memory:':
+            return None
+        with self._lock:
+            if path != self._path:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._path = path
+                self._data_version = None
+            (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+            changed = data_version != self._data_version
+            if changed:
+                if self._data_version is not None:
+                    self.version += 1
+                self._data_version = data_version
+            etag = '{0}-{1}'.format(self._run, self.version)
+        if changed and self.on_change is not None:
+            self.on_change()
+        return etag
+
+
+class Compressor(object):
+    """compresses text responses for clients that accept it, with brotli if
+    the brotli package is installed, otherwise gzip. Streamed responses are
+    compressed as they go. Compressed copies of responses with an ETag (e.g.
+    static files) are kept, up to `cache_entries` of them, so they are only
+    compressed once.
+    """
+
+    MIMETYPES = (
+        'text/html', 'text/css', 'text/csv', 'text/plain',
+        'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml'
+    )
+
+    def __init__(self, min_size=500, level=6, cache_entries=64, max_passthrough=16 * 1024 * 1024):
+        self.min_size = min_size
+        self.level = level
+        self.cache_entries = cache_entries
+        self.max_passthrough = max_passthrough
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def encoding(self):
+        """the best encoding the client accepts, or None"""
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compressor(self, encoding):
+        """an object with compress(bytes) and flush() for the encoding"""
+        if encoding == 'br':
+            return _BrotliStream(quality=min(self.level, 11))
+        # wbits 31 writes a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data, encoding):
+        c = self.compressor(encoding)
+        return c.compress(data) + c.flush()
+
+    def stream(self, chunks, encoding, charset):
+        c = self.compressor(encoding)
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode(charset)
+                data = c.compress(chunk)
+                if data:
+                    yield data
+            yield c.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def after_request(self, response):
+        if response.mimetype not in self.MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding()
+        if (encoding is None or response.status_code != 200 or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        if response.direct_passthrough:
+            # a file sent by send_file, e.g. a static file
+            if response.content_length is None or response.content_length > self.max_passthrough:
+                return response
+            response.direct_passthrough = False
+        elif response.is_streamed:
+            response.response = self.stream(response.response, encoding, response.charset)
+            response.headers.pop('Content-Length', None)
+            self._mark_encoded(response, encoding)
+            return response
+
+        etag, _ = response.get_etag()
+        key = (request.path, request.query_string, etag, encoding)
+        data = None
+        if etag is not None:
+            with self._lock:
+                data = self._cache.get(key)
+                if data is not None:
+                    self._cache.move_to_end(key)
+        if data is None:
+            raw = response.get_data()
+            if len(raw) < self.min_size:
+                return response
+            data = self.compress(raw, encoding)
+            if etag is not None:
+                with self._lock:
+                    self._cache[key] = data
+                    while len(self._cache) > self.cache_entries:
+                        self._cache.popitem(last=False)
+        response.set_data(data)
+        self._mark_encoded(response, encoding)
+        return response
+
+    def _mark_encoded(self, response, encoding):
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is a different representation of the same
+        # data, so its ETag is weak (If-None-Match compares weakly)
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+
+
+class _BrotliStream(object):
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.finish()
+
+
+class StaticFingerprints(object):
+    """adds a hash of each static file's contents to its URL (as ?v=...), so
+    the URL changes whenever the file does, and serves fingerprinted requests
+    with far-future caching headers.
+    """
+
+    def __init__(self, max_age=365 * 24 * 60 * 60):
+        self.max_age = max_age
+        self.app = None
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.url_defaults(self.url_defaults)
+        app.after_request(self.after_request)
+
+    def fingerprint(self, filename):
+        """a short hash of the static file's contents, or None if there's no
+        such file. Files are only read again when their mtime or size change.
+        """
+        try:
+            path = safe_join(self.app.static_folder, filename)
+            stat = os.stat(path)
+        except (OSError, NotFound):
+            return None
+        with self._lock:
+            cached = self._hashes.get(filename)
+            if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+                return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = ((stat.st_mtime, stat.st_size), digest)
+        return digest
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            v = self.fingerprint(values['filename'])
+            if v is not None:
+                values['v'] = v
+
+    def after_request(self, response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        v = request.args.get('v')
+        if v is None or v != self.fingerprint(request.view_args.get('filename', '')):
+            return response
+        # this URL's content never changes
+        response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(self.max_age)
+        response.expires = time.time() + self.max_age
+        return response
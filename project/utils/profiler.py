@@ -0,0 +1,153 @@
+"""An opt-in SQL profiler. Times every statement through SQLAlchemy's
+before/after_cursor_execute events and aggregates the timings by statement
+(with literal values taken out, so the same query with different values is
+counted together) and by the Flask endpoint that ran it. Statements slower
+than a threshold are logged and the most recent of them are kept.
+"""
+
+import re
+import time
+import logging
+import threading
+from collections import deque
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+NO_REQUEST = '(no request)'
+
+_strings = re.compile(r"'(?:[^']|'')*'")
+_numbers = re.compile(r"\b\d+(?:\.\d+)?\b")
+_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(statement):
+    """the statement with literals replaced by ? and IN (...) lists of any
+    length collapsed, so that it can be used as a key
+    """
+    statement = _strings.sub('?', statement)
+    statement = _numbers.sub('?', statement)
+    statement = _lists.sub('(?, ...)', statement)
+    return _whitespace.sub(' ', statement).strip()
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return NO_REQUEST
+
+
+class QueryProfiler(object):
+    """Aggregated statement timings. Listen for an engine's cursor events
+    with install(), and count requests per endpoint with count_request().
+
+    Keyword Arguments:
+        slow_ms {float} -- statements taking at least this long are logged
+            and kept in `slow` (default: {100})
+        max_statements {int} -- distinct statements to keep totals for;
+            the rest are counted under '(other)' (default: {500})
+        max_slow {int} -- how many of the most recent slow statements to
+            keep (default: {50})
+    """
+
+    def __init__(self, slow_ms=100, max_statements=500, max_slow=50):
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self.statements = {}
+        self.endpoints = {}
+        self.slow = deque(maxlen=max_slow)
+        self.started = time.time()
+
+    def install(self, target):
+        """start timing the statements run by target (an Engine, or the
+        Engine class for every engine)
+        """
+        event.listen(target, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['profiler_start'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = (time.perf_counter() - conn.info.pop('profiler_start')) * 1000
+        self.record(statement, elapsed, parameters)
+
+    def count_request(self):
+        """for before_request: count a request to the current endpoint"""
+        with self._lock:
+            self._endpoint(current_endpoint())['requests'] += 1
+
+    def _endpoint(self, name):
+        if name not in self.endpoints:
+            self.endpoints[name] = {'requests': 0, 'queries': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        return self.endpoints[name]
+
+    def record(self, statement, elapsed_ms, parameters=None):
+        endpoint = current_endpoint()
+        key = normalize(statement)
+        with self._lock:
+            if key not in self.statements and len(self.statements) >= self.max_statements:
+                key = '(other)'
+            s = self.statements.get(key)
+            if s is None:
+                s = self.statements[key] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': {}
+                }
+            s['count'] += 1
+            s['total_ms'] += elapsed_ms
+            s['max_ms'] = max(s['max_ms'], elapsed_ms)
+            s['endpoints'][endpoint] = s['endpoints'].get(endpoint, 0) + 1
+
+            e = self._endpoint(endpoint)
+            e['queries'] += 1
+            e['total_ms'] += elapsed_ms
+            e['max_ms'] = max(e['max_ms'], elapsed_ms)
+
+            if elapsed_ms >= self.slow_ms:
+                self.slow.appendleft({
+                    'sql': statement,
+                    'parameters': repr(parameters)[:200],
+                    'ms': round(elapsed_ms, 3),
+                    'endpoint': endpoint,
+                    'at': time.time()
+                })
+        if elapsed_ms >= self.slow_ms:
+            logger.warning("slow query (%.1f ms, %s): %s", elapsed_ms, endpoint, key)
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.endpoints.clear()
+            self.slow.clear()
+            self.started = time.time()
+
+    def stats(self, order_by='total_ms', limit=50):
+        """JSON-serializable totals: statements (the top `limit` by
+        `order_by`), endpoints and recent slow statements
+        """
+        with self._lock:
+            statements = [
+                dict(v, sql=k, mean_ms=v['total_ms'] / v['count'], endpoints=dict(v['endpoints']))
+                for (k, v) in self.statements.items()
+            ]
+            endpoints = [
+                dict(
+                    v, endpoint=k,
+                    queries_per_request=v['queries'] / v['requests'] if v['requests'] else None
+                )
+                for (k, v) in self.endpoints.items()
+            ]
+            slow = list(self.slow)
+        statements.sort(key=lambda s: s[order_by], reverse=True)
+        endpoints.sort(key=lambda e: e['total_ms'], reverse=True)
+        return {
+            'since': self.started,
+            'slow_ms': self.slow_ms,
+            'statements': statements[:limit],
+            'endpoints': endpoints,
+            'slow': slow
+        }
@@ -0,0 +1,136 @@
+"""Lightweight request and stage timing. Keeps a rolling window of durations
+per Flask endpoint and per named span (a stage of some work, e.g. fetching
+sales), reports their percentiles, and adds a Server-Timing header to each
+response so the browser's developer tools show where the time went.
+
+While disabled, span() hands back a shared do-nothing context manager and
+no request hooks are installed, so instrumented code costs next to nothing.
+"""
+
+import time
+import threading
+from collections import deque
+
+from flask import g, has_app_context, request
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.record_span(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def percentile(ordered, p):
+    """p-th percentile (nearest rank) of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(int(round(p / 100.0 * len(ordered) + 0.5)) - 1, len(ordered) - 1)]
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) if ordered else None,
+        'p50_ms': percentile(ordered, 50),
+        'p95_ms': percentile(ordered, 95),
+        'p99_ms': percentile(ordered, 99),
+        'max_ms': ordered[-1] if ordered else None
+    }
+
+
+class Timings(object):
+    """Rolling timings of requests and spans.
+
+    Keyword Arguments:
+        window {int} -- durations kept per endpoint/span (default: {1000})
+        server_timing {bool} -- add a Server-Timing header to responses
+            (default: {True})
+    """
+
+    def __init__(self, window=1000, server_timing=True):
+        self.window = window
+        self.server_timing = server_timing
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.spans = {}
+
+    def init_app(self, app):
+        """start timing: installs the request hooks on app"""
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        self.enabled = True
+
+    def span(self, name):
+        """context manager timing the code inside it as the stage `name`"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def _add(self, series, name, ms):
+        with self._lock:
+            if name not in series:
+                series[name] = deque(maxlen=self.window)
+            series[name].append(ms)
+
+    def record_span(self, name, ms):
+        self._add(self.spans, name, ms)
+        if has_app_context() and 'timing_spans' in g:
+            g.timing_spans.append((name, ms))
+
+    def before_request(self):
+        g.timing_start = time.perf_counter()
+        g.timing_spans = []
+
+    def after_request(self, response):
+        if 'timing_start' not in g:
+            return response
+        total = (time.perf_counter() - g.timing_start) * 1000
+        self._add(self.endpoints, request.endpoint or request.path, total)
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join(
+                ['{0};dur={1:.2f}'.format(name, ms) for (name, ms) in g.timing_spans] +
+                ['total;dur={0:.2f}'.format(total)]
+            )
+        return response
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.spans.clear()
+
+    def stats(self):
+        """percentiles per endpoint and per span, slowest (by p95) first"""
+        with self._lock:
+            endpoints = dict((k, list(v)) for (k, v) in self.endpoints.items())
+            spans = dict((k, list(v)) for (k, v) in self.spans.items())
+
+        def table(series, key):
+            rows = [dict(summarize(v), **{key: k}) for (k, v) in series.items()]
+            return sorted(rows, key=lambda r: r['p95_ms'], reverse=True)
+
+        return {
+            'window': self.window,
+            'endpoints': table(endpoints, 'endpoint'),
+            'spans': table(spans, 'span')
+        }
@@ -0,0 +1,18 @@
+import pytest
+
+from project.app import app, db, clear_caches
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """path to an empty database file that the app (and db_setup) use for
+    the length of the test
+    """
+    path = str(tmp_path / 'inventory.sqlite')
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///' + path)
+    monkeypatch.setattr('db_setup.db_path', path)
+    clear_caches()
+    yield path
+    db.session.remove()
+    db.engine.dispose()
+    clear_caches()
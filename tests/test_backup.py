@@ -0,0 +1,144 @@
+"""a backup of a database with the product_search full-text index restores
+to a working database: the same tables, rows and triggers, and a search
+index that answers queries and is kept up to date, including over an
+existing database. An older backup (an SQL dump made with iterdump) still
+restores, without the index, which db_setup can rebuild.
+"""
+
+import glob
+import sqlite3
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from project.utils.backup import cli, DUMP_NAME
+from db_setup import set_product_search
+from benchmarks.synthetic import generate
+
+SEARCH = "SELECT count(*) FROM product_search WHERE product_search MATCH 'product'"
+
+
+def tables(db_file):
+    """row count of every table (including product_search, if it's there)
+    other than the full-text index's own shadow tables
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        names = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'product_search_%' ORDER BY name"
+        )]
+        return dict((name, conn.execute('SELECT count(*) FROM "{0}"'.format(name)).fetchone()[0]) for name in names)
+    finally:
+        conn.close()
+
+
+def triggers(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name")]
+    finally:
+        conn.close()
+
+
+def search(db_file, query=SEARCH):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute(query).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run(*args):
+    result = CliRunner().invoke(cli, list(args))
+    if result.exception is not None and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+@pytest.fixture
+def original(db_file):
+    generate(db_file, 500)
+    return db_file
+
+
+@pytest.fixture
+def archive(original, tmp_path):
+    result = run('backup', original, str(tmp_path / 'backups'))
+    assert result.exit_code == 0, result.output
+    (path,) = glob.glob(str(tmp_path / 'backups' / '*.zip'))
+    return path
+
+
+def test_backup_holds_just_the_dump(archive):
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.namelist() == [DUMP_NAME]
+
+
+def test_backup_restores_tables_triggers_and_search_index(original, archive, tmp_path):
+    restored = str(tmp_path / 'restored.sqlite')
+    result = run('restore', archive, restored)
+    assert result.exit_code == 0, result.output
+    assert tables(restored) == tables(original)
+    assert triggers(restored) == triggers(original)
+    assert search(restored) == search(original)
+
+    # the index is kept up to date
+    conn = sqlite3.connect(restored)
+    conn.execute("INSERT INTO product (code, name) VALUES ('ZZ-RESTORED', 'Restoredwidget')")
+    conn.commit()
+    conn.close()
+    assert search(restored, "SELECT count(*) FROM product_search WHERE product_search MATCH 'restoredwidget'") == 1
+
+
+def test_restore_needs_force_to_replace_a_database(original, archive, tmp_path):
+    restored = str(tmp_path / 'restored.sqlite')
+    run('restore', archive, restored)
+    conn = sqlite3.connect(restored)
+    conn.execute("DELETE FROM sale")
+    conn.commit()
+    conn.close()
+
+    result = run('restore', archive, restored)
+    assert result.exit_code != 0
+    assert tables(restored)['sale'] == 0
+
+    result = run('restore', archive, restored, '--force')
+    assert result.exit_code == 0, result.output
+    assert tables(restored) == tables(original)
+    assert search(restored) == search(original)
+
+
+def test_failed_restore_leaves_the_database_as_it_was(original, archive, tmp_path):
+    restored = str(tmp_path / 'restored.sqlite')
+    run('restore', archive, restored)
+    broken = str(tmp_path / 'broken.zip')
+    with zipfile.ZipFile(archive) as zf:
+        script = zf.read(DUMP_NAME).decode('utf-8')
+    with zipfile.ZipFile(broken, mode='w') as zf:
+        zf.writestr(DUMP_NAME, script.replace('COMMIT;', 'INSERT INTO nowhere VALUES(1);\nCOMMIT;'))
+
+    with pytest.raises(sqlite3.OperationalError):
+        run('restore', broken, restored, '--force')
+    assert tables(restored) == tables(original)
+
+
+def test_older_sql_dump_restores_without_the_search_index(original, tmp_path):
+    legacy = str(tmp_path / 'legacy.zip')
+    conn = sqlite3.connect(original)
+    with zipfile.ZipFile(legacy, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(DUMP_NAME, '\n'.join(conn.iterdump()) + '\n')
+    conn.close()
+
+    restored = str(tmp_path / 'legacy.sqlite')
+    result = run('restore', legacy, restored)
+    assert result.exit_code == 0, result.output
+    assert 'db_setup.py upgrade' in result.output
+    expected = tables(original)
+    del expected['product_search']
+    assert tables(restored) == expected
+    assert triggers(restored) == [t for t in triggers(original) if not t.startswith('product_search_')]
+
+    set_product_search(restored)
+    assert search(restored) == search(original)
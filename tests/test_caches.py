@@ -0,0 +1,29 @@
+import re
+import sqlite3
+
+from project.app import app
+from benchmarks.synthetic import generate
+
+
+def listed(client, url):
+    """the row count a list view shows, i.e. "List (123)" """
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(re.search(r'List \((\d+)\)', response.get_data(as_text=True)).group(1))
+
+
+def test_list_views_notice_changes_made_outside_the_app(db_file):
+    generate(db_file, 200)
+    client = app.test_client()
+    sales = listed(client, '/admin/sale/')
+    products = listed(client, '/admin/product/')
+
+    # e.g. db_setup.py, a restore, or another copy of the app
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO product (code, name) VALUES ('ZZ-1', 'Outside')")
+    conn.execute("INSERT INTO sale (product_id, staff_id, quantity) VALUES (1, 1, 1)")
+    conn.commit()
+    conn.close()
+
+    assert listed(client, '/admin/sale/') == sales + 1
+    assert listed(client, '/admin/product/') == products + 1
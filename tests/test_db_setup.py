@@ -0,0 +1,138 @@
+import sqlite3
+
+import pytest
+from click.testing import CliRunner
+
+import db_setup
+from project.app import db, calculate_gross_sales, calculate_profit
+
+# the schema of a database made before stock receipts and the running
+# inventory were added
+BASELINE_SCHEMA = """
+CREATE TABLE supplier (
+    id INTEGER NOT NULL, name VARCHAR(255), contact VARCHAR(255),
+    email VARCHAR(255), phone VARCHAR, notes TEXT,
+    PRIMARY KEY (id), UNIQUE (name)
+);
+CREATE TABLE tag (id INTEGER NOT NULL, name VARCHAR(64), PRIMARY KEY (id));
+CREATE TABLE staff (id INTEGER NOT NULL, name TEXT, PRIMARY KEY (id));
+CREATE TABLE product (
+    id INTEGER NOT NULL, code VARCHAR(255), name VARCHAR(255),
+    quantity_per_unit INTEGER, list_price FLOAT, selling_price FLOAT,
+    description TEXT, discontinued BOOLEAN, supplier_id INTEGER,
+    fullname VARCHAR(1000), initial_volume INTEGER,
+    PRIMARY KEY (id), UNIQUE (code), UNIQUE (name),
+    CHECK (discontinued IN (0, 1)),
+    FOREIGN KEY(supplier_id) REFERENCES supplier (id)
+);
+CREATE TABLE product_tags (
+    product_id INTEGER, tag_id INTEGER,
+    FOREIGN KEY(product_id) REFERENCES product (id),
+    FOREIGN KEY(tag_id) REFERENCES tag (id)
+);
+CREATE TABLE sale (
+    id INTEGER NOT NULL, quantity INTEGER, date DATETIME, special_price FLOAT,
+    use_list_price BOOLEAN, notes TEXT, product_id INTEGER, staff_id INTEGER,
+    sold_price FLOAT,
+    PRIMARY KEY (id), CHECK (use_list_price IN (0, 1)),
+    FOREIGN KEY(product_id) REFERENCES product (id),
+    FOREIGN KEY(staff_id) REFERENCES staff (id)
+);
+INSERT INTO supplier (id, name) VALUES (1, 'Acme');
+INSERT INTO staff (id, name) VALUES (1, 'Pat');
+INSERT INTO product (id, code, name, list_price, selling_price, supplier_id, initial_volume)
+VALUES (1, 'P1', 'Widget', 10.0, 6.0, 1, 20),
+       (2, 'P2', 'Gadget', 4.0, 2.5, 1, NULL),
+       (3, 'P3', 'Gizmo', 8.0, 5.0, 1, 5);
+INSERT INTO sale (quantity, date, use_list_price, product_id, staff_id)
+VALUES (3, '2017-03-01 10:00:00', 0, 1, 1),
+       (NULL, '2017-03-02 11:00:00', 0, 1, 1),
+       (2, '2017-03-02 12:00:00', 1, 2, 1);
+"""
+
+
+def inventory(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return dict(
+            (r[0], r[1:]) for r in conn.execute(
+                "SELECT product_id, in_stock, volume_sold, volume_replaced FROM inventory"
+            )
+        )
+    finally:
+        conn.close()
+
+
+def test_upgrade_calculates_inventory_of_a_baseline_database(db_file):
+    conn = sqlite3.connect(db_file)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    result = CliRunner().invoke(db_setup.cli, ['upgrade'])
+    assert result.exit_code == 0, result.output
+
+    # (in stock, sold, replaced); a sale with no quantity counts as one
+    expected = {1: (16, 4, 0), 2: (-2, 2, 0), 3: (5, 0, 0)}
+    assert inventory(db_file) == expected
+
+    # and is kept up to date from then on
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO sale (quantity, product_id, staff_id) VALUES (2, 3, 1)")
+    conn.execute("INSERT INTO stock (product_id, units_purchased) VALUES (2, 10)")
+    conn.commit()
+    conn.close()
+    assert inventory(db_file) == {1: (16, 4, 0), 2: (8, 2, 10), 3: (3, 2, 0)}
+
+    # running it again changes nothing
+    result = CliRunner().invoke(db_setup.cli, ['upgrade'])
+    assert result.exit_code == 0, result.output
+    assert inventory(db_file) == {1: (16, 4, 0), 2: (8, 2, 10), 3: (3, 2, 0)}
+
+
+# (quantity, special_price, use_list_price) of sales of a product with a
+# list price of 4.10 and a selling price of 6.35
+SALES = [
+    (2, None, False),   # selling price
+    (3, None, True),    # list price
+    (1, 5.25, False),   # special price
+    (2, 5.25, True),    # special price wins over list price
+    (None, None, False),  # no quantity counts as one
+    (None, 7.15, False),
+    (0, None, False),
+    (3, 0, False),      # a special price of 0 is ignored
+    (7, 3.99, False),   # sold at a loss
+]
+
+
+@pytest.fixture
+def priced_sales(db_file):
+    """rows of sale with the amounts worked out by the triggers, plus the
+    product's list price, as calculate_gross_sales/calculate_profit take them
+    """
+    db.create_all()
+    db_setup.set_trigger_selling_price(db_file)
+    db_setup.set_trigger_sale_amounts(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.execute("INSERT INTO product (id, code, name, list_price, selling_price) VALUES (1, 'P1', 'Widget', 4.10, 6.35)")
+    conn.execute("INSERT INTO product (id, code, name, list_price, selling_price) VALUES (2, 'P2', 'Unpriced', 2.20, NULL)")
+    conn.executemany(
+        "INSERT INTO sale (product_id, quantity, special_price, use_list_price) VALUES (1, ?, ?, ?)", SALES
+    )
+    conn.executemany(
+        "INSERT INTO sale (product_id, quantity) VALUES (2, ?)", [(4,), (None,)]
+    )
+    conn.commit()
+    rows = conn.execute(
+        "SELECT sale.id, sale.quantity, sale.special_price, sale.sold_price, "
+        "product.list_price, sale.gross, sale.profit "
+        "FROM sale JOIN product ON product.id = sale.product_id ORDER BY sale.id"
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def test_sale_amount_trigger_matches_the_python_pricing_rules(priced_sales):
+    assert len(priced_sales) == len(SALES) + 2
+    for rec in priced_sales:
+        assert (rec['gross'], rec['profit']) == (calculate_gross_sales(rec), calculate_profit(rec)), rec
@@ -0,0 +1,97 @@
+"""the Sale and Product list pages, and their csv exports, run a fixed number
+of queries however many rows they show, i.e. no relationship is loaded row
+by row.
+"""
+
+import csv
+import io
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project.app import app, db, admin, clear_caches
+from benchmarks.synthetic import generate
+
+# url of each list page; {0} is the page size
+PAGES = {
+    "sale list": '/admin/sale/?page_size={0}',
+    "sale list, page 3": '/admin/sale/?page=2&page_size={0}',
+    "sale list, sorted by quantity": '/admin/sale/?sort=2&page_size={0}',
+    "sale list, search": '/admin/sale/?search=Product+1&page_size={0}',
+    "product list": '/admin/product/?page_size={0}',
+    "product list, page 2": '/admin/product/?page=1&page_size={0}',
+    "product list, search": '/admin/product/?search=Supplier&page_size={0}',
+}
+# (endpoint, url) of each export; the rows exported are set with the view's
+# export_max_rows
+EXPORTS = {
+    "sale export": ('sale', '/admin/sale/export/csv/'),
+    "product export": ('product', '/admin/product/export/csv/'),
+}
+PAGE_SIZES = (10, 50, 100)
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp('counts') / 'counts.sqlite')
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    generate(db_file, 5000, n_products=1000)
+    try:
+        yield app.test_client()
+    finally:
+        db.session.remove()
+        db.engine.dispose()
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+        clear_caches()
+
+
+@pytest.fixture
+def counter():
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    yield counter
+    event.remove(Engine, 'before_cursor_execute', counter)
+
+
+def view(endpoint):
+    return next(v for v in admin._views if v.endpoint == endpoint)
+
+
+def get(client, counter, url):
+    """(queries run, response body) for a fresh request of url"""
+    clear_caches()
+    counter.count = 0
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    # exports are streamed
+    body = response.get_data(as_text=True)
+    response.close()
+    return counter.count, body
+
+
+@pytest.mark.parametrize('description', sorted(PAGES))
+def test_list_page_queries_do_not_grow_with_page_size(client, counter, description):
+    counts = [get(client, counter, PAGES[description].format(size))[0] for size in PAGE_SIZES]
+    assert len(set(counts)) == 1, dict(zip(PAGE_SIZES, counts))
+
+
+@pytest.mark.parametrize('description', sorted(EXPORTS))
+def test_export_queries_do_not_grow_with_rows_exported(client, counter, monkeypatch, description):
+    endpoint, url = EXPORTS[description]
+    counts = []
+    for size in PAGE_SIZES:
+        monkeypatch.setattr(view(endpoint), 'export_max_rows', size)
+        count, body = get(client, counter, url)
+        # a header, then a line per row
+        assert len(list(csv.reader(io.StringIO(body)))) == size + 1
+        counts.append(count)
+    assert len(set(counts)) == 1, dict(zip(PAGE_SIZES, counts))
@@ -0,0 +1,71 @@
+"""the hot sale/product queries use the indexes declared on the models:
+`EXPLAIN QUERY PLAN` on a database without any of them (as created by older
+versions) against the same database after `create_indexes`.
+"""
+
+import sqlite3
+
+import pytest
+
+from project.app import app, db
+from db_setup import create_indexes
+
+# (query, parameters, index expected in the plan)
+QUERIES = {
+    "sale list, newest first": ("SELECT * FROM sale ORDER BY date DESC LIMIT 20", (), 'ix_sale_date'),
+    "sales in a date range": (
+        "SELECT * FROM sale WHERE date >= ? AND date <= ?", ('2017-01-01', '2017-02-01'), 'ix_sale_date'
+    ),
+    "sale amounts in a date range": (
+        "SELECT date, quantity, gross, profit FROM sale WHERE date >= ? AND date <= ?",
+        ('2017-01-01', '2017-02-01'), 'ix_sale_amounts'
+    ),
+    "sales by staff member": ("SELECT * FROM sale WHERE staff_id = ?", (1,), 'ix_sale_staff_id'),
+    "sales of a product": ("SELECT * FROM sale WHERE product_id = ?", (1,), 'ix_sale_product_id'),
+    "products of a supplier": ("SELECT * FROM product WHERE supplier_id = ?", (1,), 'ix_product_supplier_id'),
+    "tags of a product": (
+        "SELECT tag_id FROM product_tags WHERE product_id = ?", (1,), 'ix_product_tags_product_id_tag_id'
+    ),
+}
+
+
+def query_plan(conn, query, params):
+    return " / ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+
+
+@pytest.fixture(scope='module')
+def plans(tmp_path_factory):
+    """{description: (plan before, plan after)}"""
+    db_file = str(tmp_path_factory.mktemp('plans') / 'plans.sqlite')
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file
+    try:
+        db.create_all()
+        db.engine.dispose()
+
+        # strip every index the models declare, to get the schema older
+        # databases have (the automatic indexes of UNIQUE constraints stay)
+        conn = sqlite3.connect(db_file)
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql NOT NULL").fetchall():
+            conn.execute('DROP INDEX "{0}"'.format(name))
+        conn.commit()
+        before = dict((d, query_plan(conn, q, p)) for d, (q, p, i) in QUERIES.items())
+        conn.close()
+
+        create_indexes()
+        db.engine.dispose()
+
+        conn = sqlite3.connect(db_file)
+        after = dict((d, query_plan(conn, q, p)) for d, (q, p, i) in QUERIES.items())
+        conn.close()
+    finally:
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    return dict((d, (before[d], after[d])) for d in QUERIES)
+
+
+@pytest.mark.parametrize('description', sorted(QUERIES))
+def test_query_uses_its_index(plans, description):
+    index = QUERIES[description][2]
+    before, after = plans[description]
+    assert 'USING' not in before, before
+    assert index in after, after